@@ -86,6 +86,7 @@ default_config = edict({
     "feasinfeas":False,
     "feasinfeas_2N":False,
     "max_start_tiles":400,
+    "contraction_cache": "../optimize/data/contraction_cache",
     "n_districts": 8,
     "n_gens": 12000,
     "pop_size": 300,
@@ -99,5 +100,13 @@ default_config = edict({
     "NSGA3":False,
     "dont_fix_seeds":False,
     "pp_constraint": None,
+    "eval_cache": 10000,
+    "crossover": "copy",
+    "mutation": "flip",
+    "n_workers": 1,
+    "eval_workers": 0,
+    "islands": 1,
+    "migration_interval": 10,
+    "migrants": 4,
     "nov_params": {}
 })
\ No newline at end of file
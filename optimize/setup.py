@@ -1,10 +1,13 @@
-import os
+import os, sys
 from distutils.core import setup
 from setuptools import Extension
 from Cython.Build import cythonize
 from Cython.Distutils import build_ext
 import numpy as np
 
+# Parallel (prange) loops need OpenMP, Apple's clang does not ship it.
+OPENMP_ARGS = [] if sys.platform == 'darwin' else [ '-fopenmp' ]
+
 def find_pyx(path='.'):
     pyx_files = []
     for root, dirs, filenames in os.walk(path):
@@ -13,7 +16,9 @@ def find_pyx(path='.'):
                 pyx_files.append(
                     Extension(
                         root[2:].replace('/', '.') + '.' + fname.split('.')[0],
-                        [ os.path.join(root, fname) ]
+                        [ os.path.join(root, fname) ],
+                        extra_compile_args=OPENMP_ARGS,
+                        extra_link_args=OPENMP_ARGS
                     )
                 )
     return pyx_files
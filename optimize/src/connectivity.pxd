@@ -0,0 +1,9 @@
+cimport numpy as np
+
+cdef class Workspace:
+    cdef int[:] indptr, indices
+    cdef np.uint8_t[:] mark
+    cdef int[:] stack
+    cdef bint _can_lose(self, int[:] partition, int ti) nogil
+
+cpdef bint can_lose(int[:] partition, state, int n_districts, int ti, Workspace workspace=*) except *
@@ -0,0 +1,57 @@
+# cython: boundscheck=False
+# cython: wraparound=False
+# cython: initializedcheck=False
+# cython: nonecheck=False
+# cython: cdivision=True
+""" Local connectivity checks on the CSR adjacency of a state. """
+import numpy as np
+cimport numpy as np
+
+cdef class Workspace:
+    """ Scratch buffers for connectivity checks on one state, reused between
+        calls so they do not allocate. Use one per thread.
+    """
+    def __init__(self, state):
+        self.indptr = state.neighbors_indptr
+        self.indices = state.neighbors_indices
+        self.mark = np.zeros(state.n_tiles, dtype='uint8')
+        self.stack = np.empty(max(1, np.diff(state.neighbors_indptr).max()), dtype='i')
+
+    cdef bint _can_lose(self, int[:] partition, int ti) nogil:
+        """ If the neighbors of ti in its district stay connected to each
+            other through the ring of ti's neighbors without it.
+        """
+        cdef int k, k2, tj, tk, first, n_ring = 0, n_seen = 1, top = 1
+        cdef int di = partition[ti]
+        # Mark the neighbors in the same district 1, then 2 once visited.
+        for k in range(self.indptr[ti], self.indptr[ti+1]):
+            tj = self.indices[k]
+            if partition[tj] == di and self.mark[tj] == 0:
+                self.mark[tj] = 1
+                first = tj
+                n_ring += 1
+        if n_ring == 0:
+            return False
+        self.mark[first] = 2
+        self.stack[0] = first
+        while top > 0:
+            top -= 1
+            tj = self.stack[top]
+            for k2 in range(self.indptr[tj], self.indptr[tj+1]):
+                tk = self.indices[k2]
+                if self.mark[tk] == 1:
+                    self.mark[tk] = 2
+                    self.stack[top] = tk
+                    top += 1
+                    n_seen += 1
+        for k in range(self.indptr[ti], self.indptr[ti+1]):
+            self.mark[self.indices[k]] = 0
+        return n_seen == n_ring
+
+cpdef bint can_lose(int[:] partition, state, int n_districts, int ti, Workspace workspace=None) except *:
+    """ If tile ti can leave its district without splitting it, judged from
+        its ring of neighbors.
+    """
+    if workspace is None:
+        workspace = Workspace(state)
+    return workspace._can_lose(partition, ti)
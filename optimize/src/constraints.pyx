@@ -0,0 +1,122 @@
+# cython: boundscheck=False
+# cython: wraparound=False
+# cython: initializedcheck=False
+# cython: nonecheck=False
+# cython: cdivision=True
+import random
+import numpy as np
+cimport numpy as np
+from libc.math cimport fabs
+from src.connectivity cimport Workspace
+from src.district_stats cimport DistrictStats
+from src.utils.random_x cimport random_below
+
+cdef bint transfer(
+    int[:] partition, DistrictStats stats, Workspace workspace, int[:] indptr,
+    int[:] indices, int d, bint give, int max_tries, np.uint64_t *rng
+) nogil:
+    """ Move one tile out of district d (give) or into it. A tile is given to
+        its lightest neighboring district and taken from the heaviest one that
+        can lose it, only if that narrows the gap between the two districts so
+        tiles are not passed back and forth. Returns False if no move was
+        found in max_tries frontier samples.
+    """
+    cdef int k, ti, tj, best, _
+    cdef int[:] d_pop = stats.populations
+    cdef int[:] tile_populations = stats.tile_populations
+    if stats.n_frontier == 0:
+        return False
+    for _ in range(max_tries):
+        ti = stats.frontier_tiles[random_below(rng, stats.n_frontier)]
+        if partition[ti] != d:
+            continue
+        best = -1
+        if give:
+            if not workspace._can_lose(partition, ti):
+                continue
+            for k in range(indptr[ti], indptr[ti+1]):
+                tj = indices[k]
+                if partition[tj] != d and (best == -1 or d_pop[partition[tj]] < d_pop[best]):
+                    best = partition[tj]
+            if d_pop[best] + tile_populations[ti] >= d_pop[d]:
+                continue
+            stats._move(partition, ti, best)
+            return True
+        for k in range(indptr[ti], indptr[ti+1]):
+            tj = indices[k]
+            if partition[tj] == d:
+                continue
+            if best != -1 and d_pop[partition[tj]] <= d_pop[partition[best]]:
+                continue
+            if workspace._can_lose(partition, tj):
+                best = tj
+        if best != -1 and d_pop[partition[best]] - tile_populations[best] > d_pop[d]:
+            stats._move(partition, best, d)
+            return True
+    return False
+
+cdef int rebalance(
+    int[:] partition, DistrictStats stats, Workspace workspace, int[:] indptr,
+    int[:] indices, double pop_min, double pop_max, int max_steps,
+    np.uint64_t *rng
+) nogil:
+    """ Until every district is within [pop_min, pop_max], transfer tiles to or
+        from the district furthest from the ideal population, so districts
+        inside the bounds also pass population along. After a failed transfer
+        a random district is tried instead. Returns the number of transfers,
+        or -1 if max_steps was not enough.
+    """
+    cdef int step, d, worst
+    cdef int n_districts = stats.n_districts
+    cdef int max_tries = 4 * n_districts + 16
+    cdef int[:] d_pop = stats.populations
+    cdef double ideal = (pop_min + pop_max) / 2
+    cdef bint stuck = False, balanced
+    for step in range(max_steps):
+        worst = 0
+        balanced = True
+        for d in range(n_districts):
+            if d_pop[d] < pop_min or d_pop[d] > pop_max:
+                balanced = False
+            if fabs(d_pop[d] - ideal) > fabs(d_pop[worst] - ideal):
+                worst = d
+        if balanced:
+            return step
+        if stuck:
+            worst = random_below(rng, n_districts)
+        stuck = not transfer(
+            partition, stats, workspace, indptr, indices, worst,
+            d_pop[worst] > ideal, max_tries, rng
+        )
+    return -1
+
+def fix_pop_equality(
+    state, int[:] partition, int n_districts, double tolerance=.10,
+    int max_iters=10000, DistrictStats stats=None, Workspace workspace=None
+):
+    """ Move border tiles until every district is within tolerance of the
+        ideal population, allowing up to max_iters moves per district. stats,
+        if given, is kept up to date with every move. workspace is the
+        connectivity scratch to reuse. Returns the number of moves per
+        district it took.
+    """
+    assert 0 < tolerance < 1.0
+    cdef double ideal_pop = state.population / n_districts
+    cdef double pop_max = ideal_pop * (1+tolerance)
+    cdef double pop_min = ideal_pop * (1-tolerance)
+    cdef int[:] indptr = state.neighbors_indptr
+    cdef int[:] indices = state.neighbors_indices
+    cdef np.uint64_t rng = random.getrandbits(64)
+    cdef int steps
+    if stats is None:
+        stats = DistrictStats(state, partition, n_districts)
+    if workspace is None:
+        workspace = Workspace(state)
+    with nogil:
+        steps = rebalance(
+            partition, stats, workspace, indptr, indices, pop_min, pop_max,
+            max_iters * n_districts, &rng
+        )
+    if steps == -1:
+        raise ValueError('Failed to fix pop_equality.')
+    return steps // n_districts
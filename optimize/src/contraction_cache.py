@@ -0,0 +1,81 @@
+""" On-disk cache of the contraction hierarchy used by optimize().
+
+    The hierarchy for a state file only depends on the file contents, the
+    contraction seed and max_start_tiles, so it is stored in a directory keyed
+    by those and reloaded by later runs. Each level is saved as a binary state
+    file (see statefile) along with the mapping to the level below it.
+"""
+import os, json, shutil, hashlib, tempfile
+import numpy as np
+from src.state import State
+
+# Bump when State.contract changes so old hierarchies are not reused.
+CACHE_VERSION = 2
+
+def file_hash(path, chunk_size=1 << 20):
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def cache_key(state_path, max_start_tiles, seed):
+    return f'{file_hash(state_path)[:20]}_v{CACHE_VERSION}_s{seed}_t{max_start_tiles}'
+
+def contract_hierarchy(state, max_start_tiles, seed=None):
+    """ Contract state until it has at most max_start_tiles tiles.
+        Returns (states, mappings) ordered from the coarsest state to the input
+        state. mappings[i] maps tiles of states[i+1] to tiles of states[i],
+        the last mapping is None.
+    """
+    states = [ state ]
+    mappings = [ None ]
+    while states[-1].n_tiles > max_start_tiles:
+        level_seed = None if seed is None else seed + len(states)
+        state, mapping = states[-1].contract(seed=level_seed)
+        states.append(state)
+        mappings.append(mapping)
+    return states[::-1], mappings[::-1]
+
+def save(path, states, mappings):
+    """ Write a hierarchy to directory path, replacing it atomically. """
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(dir=parent)
+    for i, (state, mapping) in enumerate(zip(states, mappings)):
+        state.toFile(os.path.join(tmp_path, f'state_{i}.state'))
+        if mapping is not None:
+            np.save(os.path.join(tmp_path, f'mapping_{i}.npy'), mapping)
+    with open(os.path.join(tmp_path, 'index.json'), 'w') as f:
+        json.dump({ 'n_levels': len(states), 'n_tiles': [ s.n_tiles for s in states ] }, f)
+    try:
+        os.rename(tmp_path, path)
+    except OSError: # Another process wrote the same hierarchy first.
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+def load(path):
+    with open(os.path.join(path, 'index.json')) as f:
+        index = json.load(f)
+    states, mappings = [], []
+    for i in range(index['n_levels']):
+        states.append(State.fromFile(os.path.join(path, f'state_{i}.state')))
+        mapping_path = os.path.join(path, f'mapping_{i}.npy')
+        mappings.append(np.load(mapping_path) if os.path.exists(mapping_path) else None)
+    return states, mappings
+
+def load_or_contract(state_path, max_start_tiles, seed=None, cache_dir=None):
+    """ Load the islands-merged state at state_path and its contraction
+        hierarchy, from cache_dir if possible. Nothing is cached without both a
+        cache_dir and a seed, since an unseeded hierarchy is not reproducible.
+    """
+    use_cache = cache_dir is not None and seed is not None
+    if use_cache:
+        path = os.path.join(cache_dir, cache_key(state_path, max_start_tiles, seed))
+        if os.path.exists(os.path.join(path, 'index.json')):
+            print('Loading contracted states from', path)
+            return load(path)
+    state = State.fromFile(state_path).mergeIslands()[0]
+    states, mappings = contract_hierarchy(state, max_start_tiles, seed)
+    if use_cache:
+        save(path, states, mappings)
+    return states, mappings
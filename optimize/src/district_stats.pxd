@@ -0,0 +1,33 @@
+cdef void district_totals(
+    int[:] districts, int[:] tile_populations, int[:, :] tile_voters,
+    float[:] tile_areas, int[:, :] edge_tiles, float[:] edge_lengths,
+    int[:] populations, int[:, :] voters, double[:] areas,
+    double[:] perimeters, int[:] tile_counts
+) nogil
+
+cdef class DistrictStats:
+    cdef public int n_districts
+    cdef public int[:] populations, tile_counts
+    cdef public int[:, :] voters
+    cdef public double[:] areas, perimeters
+    # Tiles on a district border or the state boundary, in no order. Only the
+    # first n_border entries of border_tiles are used.
+    cdef public int n_border
+    cdef public int[:] border_tiles
+    # Tiles with a neighbor in another district, the ones mutation can move.
+    # Only the first n_frontier entries of frontier_tiles are used.
+    cdef public int n_frontier
+    cdef public int[:] frontier_tiles
+    # Per tile, its index in border_tiles and frontier_tiles or -1 and its
+    # number of neighbors in another district.
+    cdef int[:] border_pos, frontier_pos, n_foreign
+    # State arrays, shared by all copies.
+    cdef int[:] tile_populations, tile_edge_indptr, tile_edge_indices
+    cdef int[:] tile_boundaries, neighbors_indptr, neighbors_indices
+    cdef int[:, :] tile_voters, edge_tiles
+    cdef float[:] tile_areas, edge_lengths
+
+    cpdef DistrictStats copy(self)
+    cpdef void move(self, int[:] districts, int ti, int d_new) except *
+    cdef void _move(self, int[:] districts, int ti, int d_new) nogil
+    cdef void _update_border(self, int ti) nogil
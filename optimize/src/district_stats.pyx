@@ -0,0 +1,192 @@
+# cython: boundscheck=False
+# cython: wraparound=False
+# cython: initializedcheck=False
+# cython: nonecheck=False
+# cython: cdivision=True
+import numpy as np
+cimport numpy as np
+
+cdef inline int index_update(int[:] items, int[:] pos, int n, int ti, bint member) nogil:
+    """ Add or remove ti from the first n items, where pos maps each tile to
+        its index or -1. Returns the new size.
+    """
+    cdef int last
+    if member and pos[ti] == -1:
+        items[n] = ti
+        pos[ti] = n
+        return n + 1
+    if not member and pos[ti] != -1:
+        # Swap with the last entry.
+        last = items[n-1]
+        items[pos[ti]] = last
+        pos[last] = pos[ti]
+        pos[ti] = -1
+        return n - 1
+    return n
+
+cdef class DistrictStats:
+    """ Per district totals of a partition: populations, voters, areas,
+        perimeters and tile counts. Built with one scan of the state and then
+        kept up to date by move(), which only visits the edges and neighbors
+        of the moved tile. Also indexes the tiles on a border so compactness
+        metrics can gather them in O(border), and the frontier tiles so
+        mutation can sample one in O(1). Each individual in the optimization
+        carries its own copy.
+    """
+    def __init__(self, state, int[:] districts, int n_districts):
+        self.n_districts = n_districts
+        self.tile_populations = state.tile_populations
+        self.tile_voters = state.tile_voters
+        self.tile_areas = state.tile_areas
+        self.tile_edge_indptr = state.tile_edge_indptr
+        self.tile_edge_indices = state.tile_edge_indices
+        self.edge_tiles = state.edge_tiles
+        self.edge_lengths = state.edge_lengths
+        self.tile_boundaries = state.tile_boundaries
+        self.neighbors_indptr = state.neighbors_indptr
+        self.neighbors_indices = state.neighbors_indices
+        self.populations = np.zeros(n_districts, dtype='i')
+        self.tile_counts = np.zeros(n_districts, dtype='i')
+        self.voters = np.zeros((n_districts, 2), dtype='i')
+        self.areas = np.zeros(n_districts, dtype='d')
+        self.perimeters = np.zeros(n_districts, dtype='d')
+        self.border_tiles = np.empty(state.n_tiles, dtype='i')
+        self.border_pos = np.full(state.n_tiles, -1, dtype='i')
+        self.frontier_tiles = np.empty(state.n_tiles, dtype='i')
+        self.frontier_pos = np.full(state.n_tiles, -1, dtype='i')
+        self.n_foreign = np.zeros(state.n_tiles, dtype='i')
+        self.n_border = 0
+        self.n_frontier = 0
+        cdef int ti, k
+        with nogil:
+            district_totals(
+                districts, self.tile_populations, self.tile_voters, self.tile_areas,
+                self.edge_tiles, self.edge_lengths, self.populations, self.voters,
+                self.areas, self.perimeters, self.tile_counts
+            )
+            for ti in range(districts.shape[0]):
+                for k in range(self.neighbors_indptr[ti], self.neighbors_indptr[ti+1]):
+                    if districts[self.neighbors_indices[k]] != districts[ti]:
+                        self.n_foreign[ti] += 1
+                self._update_border(ti)
+
+    cpdef DistrictStats copy(self):
+        cdef DistrictStats other = DistrictStats.__new__(DistrictStats)
+        other.n_districts = self.n_districts
+        other.tile_populations = self.tile_populations
+        other.tile_voters = self.tile_voters
+        other.tile_areas = self.tile_areas
+        other.tile_edge_indptr = self.tile_edge_indptr
+        other.tile_edge_indices = self.tile_edge_indices
+        other.edge_tiles = self.edge_tiles
+        other.edge_lengths = self.edge_lengths
+        other.tile_boundaries = self.tile_boundaries
+        other.neighbors_indptr = self.neighbors_indptr
+        other.neighbors_indices = self.neighbors_indices
+        other.populations = self.populations.copy()
+        other.tile_counts = self.tile_counts.copy()
+        other.voters = self.voters.copy()
+        other.areas = self.areas.copy()
+        other.perimeters = self.perimeters.copy()
+        other.n_border = self.n_border
+        other.border_tiles = self.border_tiles.copy()
+        other.border_pos = self.border_pos.copy()
+        other.n_frontier = self.n_frontier
+        other.frontier_tiles = self.frontier_tiles.copy()
+        other.frontier_pos = self.frontier_pos.copy()
+        other.n_foreign = self.n_foreign.copy()
+        return other
+
+    cpdef void move(self, int[:] districts, int ti, int d_new) except *:
+        """ Move tile ti to district d_new, updating districts and the stats. """
+        with nogil:
+            self._move(districts, ti, d_new)
+
+    cdef void _move(self, int[:] districts, int ti, int d_new) nogil:
+        cdef int k, e, tj, d_other
+        cdef int d_old = districts[ti]
+        cdef double length
+        if d_old == d_new:
+            return
+        self.populations[d_old] -= self.tile_populations[ti]
+        self.populations[d_new] += self.tile_populations[ti]
+        self.voters[d_old, 0] -= self.tile_voters[ti, 0]
+        self.voters[d_old, 1] -= self.tile_voters[ti, 1]
+        self.voters[d_new, 0] += self.tile_voters[ti, 0]
+        self.voters[d_new, 1] += self.tile_voters[ti, 1]
+        self.areas[d_old] -= self.tile_areas[ti]
+        self.areas[d_new] += self.tile_areas[ti]
+        self.tile_counts[d_old] -= 1
+        self.tile_counts[d_new] += 1
+        # An edge adds to the perimeter of both sides when they differ.
+        for k in range(self.tile_edge_indptr[ti], self.tile_edge_indptr[ti+1]):
+            e = self.tile_edge_indices[k]
+            length = self.edge_lengths[e]
+            tj = self.edge_tiles[e, 0] if self.edge_tiles[e, 0] != ti else self.edge_tiles[e, 1]
+            if tj == -1:
+                self.perimeters[d_old] -= length
+                self.perimeters[d_new] += length
+                continue
+            d_other = districts[tj]
+            if d_other != d_old:
+                self.perimeters[d_old] -= length
+                self.perimeters[d_other] -= length
+            if d_other != d_new:
+                self.perimeters[d_new] += length
+                self.perimeters[d_other] += length
+        # Neighbors that were in d_old gain a foreign neighbor, those in d_new lose one.
+        for k in range(self.neighbors_indptr[ti], self.neighbors_indptr[ti+1]):
+            tj = self.neighbors_indices[k]
+            d_other = districts[tj]
+            if d_other == d_old:
+                self.n_foreign[ti] += 1
+                self.n_foreign[tj] += 1
+                self._update_border(tj)
+            elif d_other == d_new:
+                self.n_foreign[ti] -= 1
+                self.n_foreign[tj] -= 1
+                self._update_border(tj)
+        self._update_border(ti)
+        districts[ti] = d_new
+
+    cdef void _update_border(self, int ti) nogil:
+        """ Add or remove ti from border_tiles and frontier_tiles. """
+        self.n_border = index_update(
+            self.border_tiles, self.border_pos, self.n_border, ti,
+            self.tile_boundaries[ti] or self.n_foreign[ti] > 0
+        )
+        self.n_frontier = index_update(
+            self.frontier_tiles, self.frontier_pos, self.n_frontier, ti,
+            self.n_foreign[ti] > 0
+        )
+
+cdef void district_totals(
+    int[:] districts, int[:] tile_populations, int[:, :] tile_voters,
+    float[:] tile_areas, int[:, :] edge_tiles, float[:] edge_lengths,
+    int[:] populations, int[:, :] voters, double[:] areas,
+    double[:] perimeters, int[:] tile_counts
+) nogil:
+    """ Fill the DistrictStats totals of a partition with one scan. """
+    cdef int ti, e, da, db
+    populations[:] = 0
+    voters[:, :] = 0
+    areas[:] = 0
+    perimeters[:] = 0
+    tile_counts[:] = 0
+    for ti in range(districts.shape[0]):
+        da = districts[ti]
+        populations[da] += tile_populations[ti]
+        voters[da, 0] += tile_voters[ti, 0]
+        voters[da, 1] += tile_voters[ti, 1]
+        areas[da] += tile_areas[ti]
+        tile_counts[da] += 1
+    # An edge adds to the perimeter of both sides when they differ.
+    for e in range(edge_tiles.shape[0]):
+        da = districts[edge_tiles[e, 0]]
+        if edge_tiles[e, 1] == -1:
+            perimeters[da] += edge_lengths[e]
+        else:
+            db = districts[edge_tiles[e, 1]]
+            if da != db:
+                perimeters[da] += edge_lengths[e]
+                perimeters[db] += edge_lengths[e]
@@ -1,3 +1,6 @@
 cpdef int[:] district_populations(state, int[:] partition, int n_districts) except *
 cpdef int[:, :] district_voters(state, int[:] partition, int n_districts) except *
-cpdef bint is_frontier(int[:] partition, state, int ti) except *
+cpdef bint is_frontier(int[:] partition, int[:] indptr, int[:] indices, int ti) nogil
+cdef int find_border_tiles(
+    int[:] districts, int[:] indptr, int[:] indices, int[:] tile_boundaries, int[:] border
+) nogil
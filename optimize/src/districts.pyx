@@ -6,6 +6,9 @@
 import random
 import numpy as np
 cimport numpy as np
+from libc.stdlib cimport malloc, realloc, free
+from src.district_stats cimport DistrictStats
+from src.utils.random_x cimport random_below
 
 cpdef int[:] district_populations(state, int[:] districts, int n_districts) except *:
     cdef int[:] tile_populations = state.tile_populations
@@ -24,37 +27,169 @@ cpdef int[:,:] district_voters(state, int[:] districts, int n_districts) except
         dist_voters[districts[ti], 1] += tile_voters[ti, 1]
     return dist_voters
 
-cpdef bint is_frontier(int[:] partition, state, int ti) except *:
-    cdef int tj
+cpdef bint is_frontier(int[:] partition, int[:] indptr, int[:] indices, int ti) nogil:
+    """ If tile ti borders a tile in another district. indptr and indices are
+        the CSR adjacency of the state (state.neighbors_indptr/indices).
+    """
+    cdef int k
     cdef int di = partition[ti]
-    for tj in state.tile_neighbors[ti]:
-        if partition[tj] != di:
+    for k in range(indptr[ti], indptr[ti+1]):
+        if partition[indices[k]] != di:
             return True
     return False
 
-cpdef list district_boundry_points(state, int[:] districts, int n_districts):
+cdef inline np.uint64_t mix64(np.uint64_t z) nogil:
+    """ splitmix64 finalizer. """
+    z = (z ^ (z >> 30)) * 0xbf58476d1ce4e5b9ULL
+    z = (z ^ (z >> 27)) * 0x94d049bb133111ebULL
+    return z ^ (z >> 31)
+
+def partition_hashes(int[:, :] districts, int n_districts):
+    """ Two 64 bit hashes of each row of districts, with the district labels
+        renumbered in order of first appearance so relabeled copies of a
+        partition hash the same. Returns a (n_plans, 2) uint64 array.
+    """
+    cdef int n = districts.shape[0]
+    cdef np.uint64_t[:, :] hashes = np.zeros((n, 2), dtype='u8')
+    cdef int[:] labels = np.empty(n_districts, dtype='i')
+    cdef int i, ti, di, next_label
+    cdef np.uint64_t h0, h1, v
+    with nogil:
+        for i in range(n):
+            labels[:] = -1
+            next_label = 0
+            h0 = 0xcbf29ce484222325ULL
+            h1 = 0
+            for ti in range(districts.shape[1]):
+                di = districts[i, ti]
+                if labels[di] == -1:
+                    labels[di] = next_label
+                    next_label += 1
+                v = labels[di]
+                # FNV-1a and a splitmix64 chain.
+                h0 = (h0 ^ v) * 0x100000001b3ULL
+                h1 = mix64(h1 + v + 0x9e3779b97f4a7c15ULL)
+            hashes[i, 0] = h0
+            hashes[i, 1] = h1
+    return np.asarray(hashes)
+
+cdef int find_border_tiles(
+    int[:] districts, int[:] indptr, int[:] indices, int[:] tile_boundaries, int[:] border
+) nogil:
+    """ Write the tiles on a district border or the state boundary to border,
+        returns their number. DistrictStats.border_tiles keeps the same set.
+    """
+    cdef int ti
+    cdef int n = 0
+    for ti in range(districts.shape[0]):
+        if tile_boundaries[ti] or is_frontier(districts, indptr, indices, ti):
+            border[n] = ti
+            n += 1
+    return n
+
+cpdef int[:] border_tiles(state, int[:] districts, DistrictStats stats=None):
+    """ The tiles on a district border or the state boundary. """
+    if stats is not None:
+        return stats.border_tiles[:stats.n_border]
+    cdef int[:] border = np.empty(state.n_tiles, dtype='i')
+    cdef int[:] indptr = state.neighbors_indptr
+    cdef int[:] indices = state.neighbors_indices
+    cdef int[:] tile_boundaries = state.tile_boundaries
+    cdef int n
+    with nogil:
+        n = find_border_tiles(districts, indptr, indices, tile_boundaries, border)
+    return border[:n]
+
+cpdef list district_boundry_points(state, int[:] districts, int n_districts, DistrictStats stats=None):
     """ Helper functions for compactness metrics."""
     cdef list points = [ [] for _ in range(n_districts) ]
-    cdef int ti, di, ti_n
-    cdef float x0, y0, x1, y1
-    cdef bint add_tile
-    for ti in range(state.n_tiles):
-        di = districts[ti]
-        # x0, y0, x1, y1 = state.tile_bboxs[ti]
-        add_tile = False
-        for ti_n in state.tile_neighbors[ti]:
-            if districts[ti_n] != di:
-                add_tile = True
-                break
-        if add_tile or state.tile_boundaries[ti]:
-            points[di].extend(state.tile_hulls[ti])
-            # points[di].append((x0, y0))
-            # points[di].append((x1, y1))
-            # points[di].append((x0, y1))
-            # points[di].append((x1, y0))
+    cdef list tile_hulls = state.tile_hulls
+    for ti in border_tiles(state, districts, stats):
+        points[districts[ti]].extend(tile_hulls[ti])
     return points
 
+cdef bint queue_neighbors(
+    int[:] partition, int[:] indptr, int[:] indices, int ti, int **open_tiles,
+    int *n_open, int *capacity
+) nogil:
+    """ Append the unassigned neighbors of ti to the open_tiles array of
+        length n_open, growing it as needed. Returns False if out of memory.
+    """
+    cdef int k, tj
+    cdef int *grown
+    for k in range(indptr[ti], indptr[ti+1]):
+        tj = indices[k]
+        if partition[tj] != -1:
+            continue
+        if n_open[0] == capacity[0]:
+            grown = <int *>realloc(open_tiles[0], (2 * capacity[0] + 16) * sizeof(int))
+            if grown == NULL:
+                return False
+            open_tiles[0] = grown
+            capacity[0] = 2 * capacity[0] + 16
+        open_tiles[0][n_open[0]] = tj
+        n_open[0] += 1
+    return True
+
+cdef int grow_districts(
+    int[:] partition, int[:] seeds, int[:] indptr, int[:] indices,
+    int[:] tile_populations, np.uint64_t *rng
+) nogil:
+    """ Grow a district from each seed tile, already assigned in partition,
+        until every reachable tile is assigned. Each step gives the lightest
+        district that can still grow a random unassigned tile next to it.
+        Returns the number of tiles left unassigned, or -1 if out of memory.
+    """
+    cdef int n_districts = seeds.shape[0]
+    cdef int i, k, d, ti = 0, n_empty = partition.shape[0] - n_districts
+    # Per district, the unassigned tiles next to it. A tile is queued once per
+    # assigned neighbor and skipped when drawn if another district took it.
+    cdef int **open_tiles = <int **>malloc(n_districts * sizeof(int *))
+    cdef int *n_open = <int *>malloc(n_districts * sizeof(int))
+    cdef int *capacity = <int *>malloc(n_districts * sizeof(int))
+    cdef long *d_pop = <long *>malloc(n_districts * sizeof(long))
+    if open_tiles == NULL or n_open == NULL or capacity == NULL or d_pop == NULL:
+        n_empty = -1
+    else:
+        for d in range(n_districts):
+            open_tiles[d] = NULL
+            n_open[d] = 0
+            capacity[d] = 0
+            d_pop[d] = tile_populations[seeds[d]]
+        for d in range(n_districts):
+            if not queue_neighbors(partition, indptr, indices, seeds[d], &open_tiles[d], &n_open[d], &capacity[d]):
+                n_empty = -1
+                break
+        while n_empty > 0:
+            d = -1
+            for i in range(n_districts):
+                if n_open[i] > 0 and (d == -1 or d_pop[i] < d_pop[d]):
+                    d = i
+            if d == -1:
+                break
+            k = random_below(rng, n_open[d])
+            ti = open_tiles[d][k]
+            n_open[d] -= 1
+            open_tiles[d][k] = open_tiles[d][n_open[d]]
+            if partition[ti] != -1:
+                continue
+            partition[ti] = d
+            d_pop[d] += tile_populations[ti]
+            n_empty -= 1
+            if not queue_neighbors(partition, indptr, indices, ti, &open_tiles[d], &n_open[d], &capacity[d]):
+                n_empty = -1
+        for d in range(n_districts):
+            free(open_tiles[d])
+    free(open_tiles)
+    free(n_open)
+    free(capacity)
+    free(d_pop)
+    return n_empty
+
 def make_random(state, n_districts, seed=None, seed_perim=False):
+    """ A random contiguous partition, grown from random seed tiles with the
+        lightest district growing first so populations come out close.
+    """
     if seed is not None:
         random.seed(seed)
         np.random.seed(seed)
@@ -65,28 +200,22 @@ def make_random(state, n_districts, seed=None, seed_perim=False):
     else:
         seeds = random.sample(list(range(state.n_tiles)), n_districts)
 
-    partition = np.full(state.n_tiles, -1, dtype='i')
-    indxs = np.arange(0, state.n_tiles)
-    n_empty = state.n_tiles - len(seeds)
-
+    cdef int[:] partition = np.full(state.n_tiles, -1, dtype='i')
+    cdef int[:] seeds_view = np.array(seeds, dtype='i')
+    cdef int[:] indptr = state.neighbors_indptr
+    cdef int[:] indices = state.neighbors_indices
+    cdef int[:] tile_populations = state.tile_populations
+    cdef np.uint64_t rng = random.getrandbits(64)
+    cdef int n_empty
     for i, s in enumerate(seeds):
         partition[s] = i
-
-    while n_empty > 0:
-        np.random.shuffle(indxs)
-        for t in indxs:
-            if partition[t] != -1:
-                continue
-            options = []
-            for t_other in state.tile_neighbors[t]:
-                if partition[t_other] != -1:
-                    options.append(t_other)
-            if len(options):
-                t_other = random.choice(options)
-                partition[t] = partition[t_other]
-                n_empty -= 1
-
-    return partition
+    with nogil:
+        n_empty = grow_districts(partition, seeds_view, indptr, indices, tile_populations, &rng)
+    if n_empty == -1:
+        raise MemoryError()
+    if n_empty > 0:
+        raise ValueError('Tiles not connected to any seed.')
+    return np.asarray(partition)
 
 # def make_random(state, n_districts):
     # boundry_tiles = np.where(state.tile_boundaries)[0].tolist()
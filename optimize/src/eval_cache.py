@@ -0,0 +1,44 @@
+""" Memoized objective values. Crossover copies its parents and mutation can
+    fail to move any tile, so many offspring repeat partitions that were
+    already scored.
+"""
+from collections import OrderedDict
+import numpy as np
+from src.districts import partition_hashes
+
+class EvalCache:
+    """ LRU cache of the (F, G) rows of partitions, keyed by
+        districts.partition_hashes. Holds at most max_size entries.
+    """
+    def __init__(self, max_size=10000):
+        assert max_size > 0
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def keys(self, districts, n_districts):
+        hashes = partition_hashes(np.ascontiguousarray(districts, dtype='i'), n_districts)
+        return [ tuple(h) for h in hashes.tolist() ]
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, f, g):
+        self.entries[key] = (f, g)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def summary(self):
+        total = self.hits + self.misses
+        return 'cache %i/%i' % (self.hits, total)
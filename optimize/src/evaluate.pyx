@@ -0,0 +1,173 @@
+# cython: boundscheck=False
+# cython: wraparound=False
+# cython: initializedcheck=False
+# cython: nonecheck=False
+# cython: cdivision=True
+""" Batched evaluation of a population of partitions.
+
+    Computes every metric and constraint of a whole (n_plans, n_tiles) matrix
+    in native code, with rows evaluated in parallel by OpenMP.
+"""
+from cython.parallel cimport prange, threadid
+from libc.math cimport fmax
+import os
+import numpy as np
+cimport numpy as np
+from src.district_stats cimport DistrictStats, district_totals
+from src.districts cimport find_border_tiles
+from src.metrics.equality cimport equality_score
+from src.metrics.competitiveness cimport competitiveness_score
+from src.metrics.fairness cimport efficiency_gap_score
+from src.metrics.compactness cimport polsby_popper_score, center_distance_score, \
+    convex_hull_score, reock_score, district_boundary_counts, district_boundary_points
+
+# Metrics that have a native batched implementation, in code order.
+METRICS = [
+    'equality', 'competitiveness', 'efficiency_gap', 'polsby_popper',
+    'center_distance', 'convex_hull', 'reock'
+]
+cdef enum:
+    EQUALITY, COMPETITIVENESS, EFFICIENCY_GAP, POLSBY_POPPER, CENTER_DISTANCE,
+    CONVEX_HULL, REOCK
+
+cdef int load_border(
+    int[:] districts, bint has_stats, int[:] stats_border, int[:] indptr,
+    int[:] indices, int[:] tile_boundaries, int[:] border
+) nogil:
+    """ Copy the border tiles of a row with stats to border, or find them. """
+    if has_stats:
+        border[:stats_border.shape[0]] = stats_border
+        return stats_border.shape[0]
+    return find_border_tiles(districts, indptr, indices, tile_boundaries, border)
+
+def evaluate_batch(
+    state, int[:, :] districts, int n_districts, list metrics,
+    list constraints=[], thresholds=None, list stats=None, n_threads=None
+):
+    """ Evaluate each row of districts. metrics and constraints are lists of
+        names from METRICS. G[i, c] is 1 when metric constraints[c] of row i
+        is above thresholds[c]. stats is an optional DistrictStats per row,
+        rows without one are scanned. n_threads defaults to the cpu count.
+        Returns (F, G).
+    """
+    cdef int n = districts.shape[0]
+    cdef list names = list(metrics) + [ c for c in constraints if c not in metrics ]
+    cdef int[:] codes = np.array([ METRICS.index(name) for name in names ], dtype='i')
+    cdef int n_values = len(names)
+    cdef double[:, :] values = np.zeros((n, n_values))
+
+    # Per row district totals and scratch.
+    cdef int[:, :] populations = np.zeros((n, n_districts), dtype='i')
+    cdef int[:, :, :] voters = np.zeros((n, n_districts, 2), dtype='i')
+    cdef double[:, :] areas = np.zeros((n, n_districts))
+    cdef double[:, :] perimeters = np.zeros((n, n_districts))
+    cdef int[:, :] tile_counts = np.zeros((n, n_districts), dtype='i')
+    cdef float[:, :, :] dist_centers = np.zeros((n, n_districts, 2), dtype='f')
+    cdef float[:, :] dist_sizes = np.zeros((n, n_districts), dtype='f')
+    cdef np.uint8_t[:] has_stats = np.zeros(n, dtype='uint8')
+    cdef DistrictStats s
+    cdef int i, j
+    if stats is not None:
+        for i in range(n):
+            s = stats[i]
+            if s is None:
+                continue
+            has_stats[i] = 1
+            populations[i, :] = s.populations
+            voters[i, :, :] = s.voters
+            areas[i, :] = s.areas
+            perimeters[i, :] = s.perimeters
+            tile_counts[i, :] = s.tile_counts
+
+    cdef int[:] tile_populations = state.tile_populations
+    cdef int[:, :] tile_voters = state.tile_voters
+    cdef float[:] tile_areas = state.tile_areas
+    cdef int[:, :] edge_tiles = state.edge_tiles
+    cdef float[:] edge_lengths = state.edge_lengths
+    cdef float[:, :] tile_centers = state.tile_centers
+    cdef float ideal_pop = float(state.population) / n_districts
+    cdef double population = state.population
+    cdef float max_dist = fmax(state.bbox[2]-state.bbox[0], state.bbox[3]-state.bbox[1])
+    cdef double area = state.area
+
+    # Border points for convex_hull and reock. Border tiles come from the
+    # stats, packed here, or a scan. The scratch is per thread and sized for
+    # the row with the most points.
+    cdef int n_thread = n_threads or os.cpu_count() or 1
+    cdef bint use_boundary = 'convex_hull' in names or 'reock' in names
+    cdef double[:, :] hull_points = state.tile_hull_points if use_boundary else np.empty((0, 2))
+    cdef np.int64_t[:] hull_indptr = state.tile_hull_indptr if use_boundary else np.empty(0, dtype='i8')
+    cdef int[:] indptr = state.neighbors_indptr
+    cdef int[:] indices = state.neighbors_indices
+    cdef int[:] tile_boundaries = state.tile_boundaries
+    cdef np.int64_t[:] stats_border_indptr = np.zeros(n+1, dtype='i8')
+    cdef int[:] stats_border = np.empty(0, dtype='i')
+    if use_boundary and stats is not None:
+        for i in range(n):
+            s = stats[i]
+            stats_border_indptr[i+1] = stats_border_indptr[i] + (s.n_border if s is not None else 0)
+        stats_border = np.concatenate([ np.empty(0, dtype='i') ] + [
+            np.asarray(s.border_tiles[:s.n_border]) for s in stats if s is not None
+        ])
+    cdef int[:, :] border = np.empty((n_thread if use_boundary else 0, state.n_tiles), dtype='i')
+    cdef int n_border
+    cdef np.int64_t[:, :] point_indptr = np.zeros((n, n_districts+1), dtype='i8')
+    cdef np.int64_t[:] n_points = np.zeros(n, dtype='i8')
+    cdef int t
+    if use_boundary:
+        for i in prange(n, nogil=True, schedule='dynamic', num_threads=n_thread):
+            t = threadid()
+            n_border = load_border(
+                districts[i], has_stats[i],
+                stats_border[stats_border_indptr[i]:stats_border_indptr[i+1]],
+                indptr, indices, tile_boundaries, border[t]
+            )
+            n_points[i] = district_boundary_counts(
+                districts[i], border[t, :n_border], hull_indptr, point_indptr[i]
+            )
+    cdef np.int64_t max_points = np.max(n_points) if n > 0 else 0
+    cdef double[:, :, ::1] points = np.empty((n_thread, max_points, 2), dtype='d')
+    cdef double[:, :, ::1] hulls = np.empty((n_thread, max_points+1, 2), dtype='d')
+
+    for i in prange(n, nogil=True, schedule='dynamic', num_threads=n_thread):
+        t = threadid()
+        if not has_stats[i]:
+            district_totals(
+                districts[i], tile_populations, tile_voters, tile_areas, edge_tiles,
+                edge_lengths, populations[i], voters[i], areas[i], perimeters[i],
+                tile_counts[i]
+            )
+        if use_boundary:
+            n_border = load_border(
+                districts[i], has_stats[i],
+                stats_border[stats_border_indptr[i]:stats_border_indptr[i+1]],
+                indptr, indices, tile_boundaries, border[t]
+            )
+            district_boundary_points(
+                districts[i], border[t, :n_border], hull_points, hull_indptr,
+                point_indptr[i], points[t]
+            )
+        for j in range(n_values):
+            if codes[j] == EQUALITY:
+                values[i, j] = equality_score(populations[i], ideal_pop)
+            elif codes[j] == COMPETITIVENESS:
+                values[i, j] = competitiveness_score(voters[i], 0.02)
+            elif codes[j] == EFFICIENCY_GAP:
+                values[i, j] = efficiency_gap_score(voters[i], population)
+            elif codes[j] == POLSBY_POPPER:
+                values[i, j] = polsby_popper_score(areas[i], perimeters[i])
+            elif codes[j] == CENTER_DISTANCE:
+                values[i, j] = center_distance_score(
+                    districts[i], tile_centers, dist_centers[i], dist_sizes[i], max_dist
+                )
+            elif codes[j] == CONVEX_HULL:
+                values[i, j] = convex_hull_score(point_indptr[i], points[t], hulls[t], area)
+            elif codes[j] == REOCK:
+                values[i, j] = reock_score(point_indptr[i], points[t], hulls[t], area)
+
+    values_np = np.asarray(values)
+    F = values_np[:, :len(metrics)].copy()
+    G = np.zeros((n, len(constraints)))
+    for j, name in enumerate(constraints):
+        G[:, j] = values_np[:, names.index(name)] > thresholds[j]
+    return F, G
@@ -1,5 +1,7 @@
+# Metrics are called as f(state, districts, n_districts, stats=None), where
+# stats is an optional DistrictStats of the partition to read totals from.
 from .fairness import efficiency_gap, dem_advantage, rep_advantage, lost_votes 
-from .compactness import reock, convex_hull, polsby_popper, center_distance, bounding_hulls, bounding_circles
+from .compactness import reock, reock_batch, convex_hull, convex_hull_batch, polsby_popper, polsby_popper_batch, center_distance, bounding_hulls, bounding_circles
 from .equality import equality
 from .competitiveness import competitiveness
 
@@ -0,0 +1,19 @@
+cimport numpy as np
+cdef float center_distance_score(
+    int[:] districts, float[:, :] tile_centers, float[:, :] dist_centers,
+    float[:] dist_sizes, float max_dist
+) nogil
+cdef void district_areas_perimeters(
+    int[:] districts, float[:] tile_areas, int[:, :] edge_tiles,
+    float[:] edge_lengths, double[:] dist_areas, double[:] dist_perimeters
+) nogil
+cdef float polsby_popper_score(double[:] dist_areas, double[:] dist_perimeters) nogil
+cdef np.int64_t district_boundary_counts(
+    int[:] districts, int[:] border, np.int64_t[:] hull_indptr, np.int64_t[:] point_indptr
+) nogil
+cdef void district_boundary_points(
+    int[:] districts, int[:] border, double[:, :] hull_points,
+    np.int64_t[:] hull_indptr, np.int64_t[:] point_indptr, double[:, ::1] points
+) nogil
+cdef float convex_hull_score(np.int64_t[:] point_indptr, double[:, ::1] points, double[:, ::1] hull, double area) nogil
+cdef float reock_score(np.int64_t[:] point_indptr, double[:, ::1] points, double[:, ::1] hull, double area) nogil
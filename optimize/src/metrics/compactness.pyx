@@ -6,34 +6,48 @@
 from libc.math cimport sqrt, fabs, fmax, pi
 import numpy as np
 cimport numpy as np
-from scipy.spatial import ConvexHull
 
-from src.utils import polygon
-from src.utils.minimum_circle import make_circle
-from src.districts import district_boundry_points
+from src.utils.hull_x cimport convex_hull as hull_of, hull_area
+from src.utils.minimum_circle_x cimport Circle, bounding_circle
+from src.districts import border_tiles
+from src.districts cimport find_border_tiles
+from src.district_stats cimport DistrictStats
 
 ################################################################################
 # Utils.
 
-cdef inline float udist_sq(float[:] a, float[:] b):
+cdef inline float udist_sq(float[:] a, float[:] b) nogil:
     cdef float x = a[0] - b[0]
     cdef float y = a[1] - b[1]
     return x*x + y*y
 
-cdef inline float udist(float[:] a, float[:] b):
+cdef inline float udist(float[:] a, float[:] b) nogil:
     """ Euclidian distance between 2 2D vectors. Faster than np.linalg.norm. """
     return sqrt(udist_sq(a, b))
 
 ################################################################################
 
-cpdef float center_distance(state, int[:] districts, int n_districts) except *:
+cpdef float center_distance(state, int[:] districts, int n_districts, DistrictStats stats=None) except *:
     """ Returns the mean distance squared from each tile to its respective
         district center. Normalized to [0, 1] """
     cdef float[:,:] tile_centers = state.tile_centers
     cdef float[:,:] dist_centers = np.zeros((n_districts, 2), dtype='float32')
     cdef float[:] dist_sizes = np.zeros(n_districts, dtype='float32')
+    cdef float max_dist = fmax(state.bbox[2]-state.bbox[0], state.bbox[3]-state.bbox[1])
+    return center_distance_score(districts, tile_centers, dist_centers, dist_sizes, max_dist)
+
+cdef float center_distance_score(
+    int[:] districts, float[:, :] tile_centers, float[:, :] dist_centers,
+    float[:] dist_sizes, float max_dist
+) nogil:
+    """ center_distance with caller provided (n_districts, 2) and
+        (n_districts,) scratch arrays.
+    """
     cdef int ti, di
-    cdef int n_tiles = state.n_tiles
+    cdef int n_tiles = districts.shape[0]
+    cdef int n_districts = dist_sizes.shape[0]
+    dist_centers[:, :] = 0
+    dist_sizes[:] = 0
 
     # Find the average point.
     for ti in range(n_tiles):
@@ -46,7 +60,6 @@ cpdef float center_distance(state, int[:] districts, int n_districts) except *:
         dist_centers[di, 1] /= dist_sizes[di]
 
     # Find average distance to dsitrict center.
-    cdef float max_dist = fmax(state.bbox[2]-state.bbox[0], state.bbox[3]-state.bbox[1])
     cdef float mean_dist_sq = 0.0 
     for ti in range(n_tiles):
         di = districts[ti]
@@ -56,55 +69,269 @@ cpdef float center_distance(state, int[:] districts, int n_districts) except *:
 
 ################################################################################
 
-cpdef float polsby_popper(state, int[:] districts, int n_districts) except *:
-    cdef float[:] dist_areas      = np.zeros(n_districts, dtype='f')
-    cdef float[:] dist_perimeters = np.zeros(n_districts, dtype='f')
-    cdef float[:] tile_areas = state.tile_areas
-    cdef int ti, di
-    cdef object ti_1
-    cdef dict edge_data
-
-    for ti in range(state.n_tiles):
-        di = districts[ti]
-        dist_areas[di] += tile_areas[ti]
-
-        for ti_1, edge_data in state.tile_edges[ti].items():
-            if ti_1 == 'boundry' or districts[ti] != districts[ti_1]:
-                dist_perimeters[di] += edge_data['length']
+cdef void district_areas_perimeters(
+    int[:] districts, float[:] tile_areas, int[:, :] edge_tiles,
+    float[:] edge_lengths, double[:] dist_areas, double[:] dist_perimeters
+) nogil:
+    """ Fill the area and perimeter of each district from the state edge table.
+        An edge counts toward the perimeter of both sides if they differ.
+    """
+    cdef int ti, e, da, db
+    dist_areas[:] = 0
+    dist_perimeters[:] = 0
+    for ti in range(districts.shape[0]):
+        dist_areas[districts[ti]] += tile_areas[ti]
+    for e in range(edge_tiles.shape[0]):
+        da = districts[edge_tiles[e, 0]]
+        if edge_tiles[e, 1] == -1:
+            dist_perimeters[da] += edge_lengths[e]
+        else:
+            db = districts[edge_tiles[e, 1]]
+            if da != db:
+                dist_perimeters[da] += edge_lengths[e]
+                dist_perimeters[db] += edge_lengths[e]
 
+cdef float polsby_popper_score(double[:] dist_areas, double[:] dist_perimeters) nogil:
+    cdef int di
+    cdef int n_districts = dist_areas.shape[0]
     cdef float pp_score = 0
     for di in range(n_districts):
         pp_score += sqrt((4 * pi * dist_areas[di]) / (dist_perimeters[di]*dist_perimeters[di]))
-    
     pp_score /= n_districts
-
     return 1.0 - pp_score
 
+cpdef float polsby_popper(state, int[:] districts, int n_districts, DistrictStats stats=None) except *:
+    if stats is not None:
+        return polsby_popper_score(stats.areas, stats.perimeters)
+    cdef double[:] dist_areas      = np.zeros(n_districts, dtype='d')
+    cdef double[:] dist_perimeters = np.zeros(n_districts, dtype='d')
+    cdef float[:] tile_areas = state.tile_areas
+    cdef int[:, :] edge_tiles = state.edge_tiles
+    cdef float[:] edge_lengths = state.edge_lengths
+    cdef float score
+    with nogil:
+        district_areas_perimeters(
+            districts, tile_areas, edge_tiles, edge_lengths, dist_areas, dist_perimeters
+        )
+        score = polsby_popper_score(dist_areas, dist_perimeters)
+    return score
+
+cpdef float[:] polsby_popper_batch(state, int[:, :] districts, int n_districts):
+    """ polsby_popper for each row of a (n_plans, n_tiles) matrix. """
+    cdef int i
+    cdef int n = districts.shape[0]
+    cdef float[:] scores = np.zeros(n, dtype='f')
+    cdef double[:] dist_areas      = np.zeros(n_districts, dtype='d')
+    cdef double[:] dist_perimeters = np.zeros(n_districts, dtype='d')
+    cdef float[:] tile_areas = state.tile_areas
+    cdef int[:, :] edge_tiles = state.edge_tiles
+    cdef float[:] edge_lengths = state.edge_lengths
+    with nogil:
+        for i in range(n):
+            district_areas_perimeters(
+                districts[i], tile_areas, edge_tiles, edge_lengths, dist_areas, dist_perimeters
+            )
+            scores[i] = polsby_popper_score(dist_areas, dist_perimeters)
+    return scores
+
 ################################################################################
 
-def sum_sq(iter):
-    return sum(v * v for v in iter)
+# Convex hull and Reock work on the hull points of the tiles on the border
+# of each district (state.tile_hull_points), gathered into one packed array.
+# The border tiles come from DistrictStats or districts.find_border_tiles.
+
+cdef np.int64_t district_boundary_counts(
+    int[:] districts, int[:] border, np.int64_t[:] hull_indptr, np.int64_t[:] point_indptr
+) nogil:
+    """ Fill point_indptr with the offsets of each district's border points,
+        see district_boundary_points. Returns the total.
+    """
+    cdef int k, ti, di
+    cdef int n_districts = point_indptr.shape[0] - 1
+    point_indptr[:] = 0
+    for k in range(border.shape[0]):
+        ti = border[k]
+        point_indptr[districts[ti]+1] += hull_indptr[ti+1] - hull_indptr[ti]
+    for di in range(n_districts):
+        point_indptr[di+1] += point_indptr[di]
+    return point_indptr[n_districts]
+
+cdef void district_boundary_points(
+    int[:] districts, int[:] border, double[:, :] hull_points,
+    np.int64_t[:] hull_indptr, np.int64_t[:] point_indptr, double[:, ::1] points
+) nogil:
+    """ Gather the hull points of the border tiles of each district into
+        points. District di gets points[point_indptr[di]:point_indptr[di+1]],
+        point_indptr must come from district_boundary_counts.
+    """
+    cdef int k, ti, di
+    cdef np.int64_t v, j
+    cdef int n_districts = point_indptr.shape[0] - 1
+    # Use point_indptr as a cursor per district, then shift it back.
+    for k in range(border.shape[0]):
+        ti = border[k]
+        di = districts[ti]
+        j = point_indptr[di]
+        for v in range(hull_indptr[ti], hull_indptr[ti+1]):
+            points[j, 0] = hull_points[v, 0]
+            points[j, 1] = hull_points[v, 1]
+            j += 1
+        point_indptr[di] = j
+    for di in range(n_districts, 0, -1):
+        point_indptr[di] = point_indptr[di-1]
+    point_indptr[0] = 0
+
+cdef float convex_hull_score(np.int64_t[:] point_indptr, double[:, ::1] points, double[:, ::1] hull, double area) nogil:
+    """ convex_hull from the gathered district_boundary_points. hull is
+        scratch with one more row than points.
+    """
+    cdef int di, n
+    cdef double hull_area_i
+    cdef double hulls_area = 0
+    for di in range(point_indptr.shape[0] - 1):
+        n = hull_of(
+            points[point_indptr[di]:point_indptr[di+1]],
+            hull[point_indptr[di]:point_indptr[di+1]+1]
+        )
+        hull_area_i = hull_area(hull[point_indptr[di]:], n)
+        hulls_area += hull_area_i * hull_area_i
+    return 1.0 - hulls_area / (area * area)
+
+cdef float reock_score(np.int64_t[:] point_indptr, double[:, ::1] points, double[:, ::1] hull, double area) nogil:
+    """ reock from the gathered district_boundary_points. hull is scratch
+        with one more row than points.
+    """
+    cdef int di
+    cdef Circle c
+    cdef double circles_area = 0
+    for di in range(point_indptr.shape[0] - 1):
+        c = bounding_circle(
+            points[point_indptr[di]:point_indptr[di+1]],
+            hull[point_indptr[di]:point_indptr[di+1]+1]
+        )
+        circles_area += (pi * c.r * c.r) * (pi * c.r * c.r)
+    return .1 * circles_area / (area * area)
+
+cdef enum:
+    CONVEX_HULL, REOCK
+
+cdef float[:] boundary_scores(state, int[:, :] districts, int n_districts, int metric):
+    """ convex_hull or reock of each row of districts. """
+    cdef int i
+    cdef int n = districts.shape[0]
+    cdef float[:] scores = np.zeros(n, dtype='f')
+    cdef np.int64_t[:, :] point_indptr = np.zeros((n, n_districts+1), dtype='i8')
+    cdef double[:, :] hull_points = state.tile_hull_points
+    cdef np.int64_t[:] hull_indptr = state.tile_hull_indptr
+    cdef int[:] indptr = state.neighbors_indptr
+    cdef int[:] indices = state.neighbors_indices
+    cdef int[:] tile_boundaries = state.tile_boundaries
+    cdef int[:] border = np.empty(state.n_tiles, dtype='i')
+    cdef int n_border
+    cdef double area = state.area
+    cdef np.int64_t max_points = 0
+    # Size the scratch for the row with the most border points.
+    with nogil:
+        for i in range(n):
+            n_border = find_border_tiles(districts[i], indptr, indices, tile_boundaries, border)
+            max_points = max(max_points, district_boundary_counts(
+                districts[i], border[:n_border], hull_indptr, point_indptr[i]
+            ))
+    cdef double[:, ::1] points = np.empty((max_points, 2), dtype='d')
+    cdef double[:, ::1] hull = np.empty((max_points+1, 2), dtype='d')
+    with nogil:
+        for i in range(n):
+            n_border = find_border_tiles(districts[i], indptr, indices, tile_boundaries, border)
+            district_boundary_points(
+                districts[i], border[:n_border], hull_points, hull_indptr,
+                point_indptr[i], points
+            )
+            if metric == CONVEX_HULL:
+                scores[i] = convex_hull_score(point_indptr[i], points, hull, area)
+            else:
+                scores[i] = reock_score(point_indptr[i], points, hull, area)
+    return scores
 
-def bounding_hulls(state, districts, n_districts):
+cdef tuple gather_boundary_points(state, int[:] districts, int n_districts, DistrictStats stats):
+    """ district_boundary_points into a new array, returns (point_indptr, points). """
+    cdef int[:] border = border_tiles(state, districts, stats)
+    cdef np.int64_t[:] point_indptr = np.zeros(n_districts+1, dtype='i8')
+    cdef double[:, :] hull_points = state.tile_hull_points
+    cdef np.int64_t[:] hull_indptr = state.tile_hull_indptr
+    cdef double[:, ::1] points
+    cdef np.int64_t n_points
+    with nogil:
+        n_points = district_boundary_counts(districts, border, hull_indptr, point_indptr)
+    points = np.empty((n_points, 2), dtype='d')
+    with nogil:
+        district_boundary_points(districts, border, hull_points, hull_indptr, point_indptr, points)
+    return point_indptr, points
+
+################################################################################
+
+def bounding_hulls(state, int[:] districts, int n_districts, DistrictStats stats=None):
     """ Return the convex hull of each district. """
-    dist_points = district_boundry_points(state, districts, n_districts)
-    return [ polygon.convex_hull(pl) for pl in dist_points ]
+    cdef np.int64_t[:] point_indptr
+    cdef double[:, ::1] points
+    point_indptr, points = gather_boundary_points(state, districts, n_districts, stats)
+    cdef double[:, ::1] hull = np.empty((points.shape[0]+1, 2), dtype='d')
+    cdef list hulls = []
+    cdef int di, n
+    for di in range(n_districts):
+        n = hull_of(
+            points[point_indptr[di]:point_indptr[di+1]],
+            hull[point_indptr[di]:point_indptr[di+1]+1]
+        )
+        hulls.append(np.asarray(hull[point_indptr[di]:point_indptr[di]+n]).tolist())
+    return hulls
 
-def convex_hull(state, districts, n_districts):
+cpdef float convex_hull(state, int[:] districts, int n_districts, DistrictStats stats=None) except *:
     """ Compactness metric: inverse to the sum hull areas. """
-    hulls = bounding_hulls(state, districts, n_districts)
-    hulls_area = sum_sq( polygon.area([ h ]) for h in hulls )
-    return 1.0 - hulls_area / (state.area * state.area)
+    cdef np.int64_t[:] point_indptr
+    cdef double[:, ::1] points
+    point_indptr, points = gather_boundary_points(state, districts, n_districts, stats)
+    cdef double[:, ::1] hull = np.empty((points.shape[0]+1, 2), dtype='d')
+    cdef double area = state.area
+    cdef float score
+    with nogil:
+        score = convex_hull_score(point_indptr, points, hull, area)
+    return score
+
+cpdef float[:] convex_hull_batch(state, int[:, :] districts, int n_districts):
+    """ convex_hull for each row of a (n_plans, n_tiles) matrix. """
+    return boundary_scores(state, districts, n_districts, CONVEX_HULL)
 
 ################################################################################
 
-def bounding_circles(state, districts, n_districts):
-    """ Return the bounding circle of each district. """
-    dist_points = district_boundry_points(state, districts, n_districts)
-    return [ make_circle(pl) for pl in dist_points ]
+def bounding_circles(state, int[:] districts, int n_districts, DistrictStats stats=None):
+    """ Return the bounding circle (x, y, r) of each district. """
+    cdef np.int64_t[:] point_indptr
+    cdef double[:, ::1] points
+    point_indptr, points = gather_boundary_points(state, districts, n_districts, stats)
+    cdef double[:, ::1] hull = np.empty((points.shape[0]+1, 2), dtype='d')
+    cdef Circle c
+    cdef list circles = []
+    cdef int di
+    for di in range(n_districts):
+        c = bounding_circle(
+            points[point_indptr[di]:point_indptr[di+1]],
+            hull[point_indptr[di]:point_indptr[di+1]+1]
+        )
+        circles.append((c.x, c.y, c.r))
+    return circles
 
-def reock(state, districts, n_districts):
+cpdef float reock(state, int[:] districts, int n_districts, DistrictStats stats=None) except *:
     """ Compactness metric: inverse to the sum circle areas. """
-    circles = bounding_circles(state, districts, n_districts)
-    circles_area = sum_sq( pi * c[2]**2 for c in circles )
-    return .1 * circles_area / (state.area * state.area)
+    cdef np.int64_t[:] point_indptr
+    cdef double[:, ::1] points
+    point_indptr, points = gather_boundary_points(state, districts, n_districts, stats)
+    cdef double[:, ::1] hull = np.empty((points.shape[0]+1, 2), dtype='d')
+    cdef double area = state.area
+    cdef float score
+    with nogil:
+        score = reock_score(point_indptr, points, hull, area)
+    return score
+
+cpdef float[:] reock_batch(state, int[:, :] districts, int n_districts):
+    """ reock for each row of a (n_plans, n_tiles) matrix. """
+    return boundary_scores(state, districts, n_districts, REOCK)
@@ -0,0 +1 @@
+cdef float competitiveness_score(int[:, :] dist_voters, float threshold) nogil
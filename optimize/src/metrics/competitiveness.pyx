@@ -5,15 +5,25 @@
 # cython: cdivision=True
 from libc.math cimport fabs, fmax
 from src.districts cimport district_voters
+from src.district_stats cimport DistrictStats
 
-cpdef float competitiveness(state, int[:] districts, int n_districts, float threshold=0.02) except *:
+cpdef float competitiveness(
+    state, int[:] districts, int n_districts, float threshold=0.02, DistrictStats stats=None
+) except *:
     # Consider anything below 2% equally competitive.
-    cdef int[:, :] dist_voters = district_voters(state, districts, n_districts)
+    cdef int[:, :] dist_voters
+    if stats is None:
+        dist_voters = district_voters(state, districts, n_districts)
+    else:
+        dist_voters = stats.voters
+    return competitiveness_score(dist_voters, threshold)
+
+cdef float competitiveness_score(int[:, :] dist_voters, float threshold) nogil:
     cdef float margin, diff
     cdef float max_margin = 0.0
     cdef int di
-    for di in range(n_districts):
-        diff = float(fabs(dist_voters[di, 0] - dist_voters[di, 1]))
+    for di in range(dist_voters.shape[0]):
+        diff = fabs(dist_voters[di, 0] - dist_voters[di, 1])
         margin = diff / (dist_voters[di, 0] + dist_voters[di, 1])
         max_margin = fmax(max_margin, margin)
-    return fmax(max_margin, threshold)
\ No newline at end of file
+    return fmax(max_margin, threshold)
@@ -0,0 +1 @@
+cdef float equality_score(int[:] dist_populations, float ideal_pop) nogil
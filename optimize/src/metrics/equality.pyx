@@ -7,14 +7,22 @@ from libc.math cimport fmax, fmin, fabs
 import numpy as np
 cimport numpy as np
 from src.districts cimport district_voters, district_populations
+from src.district_stats cimport DistrictStats
 
-cpdef float equality(state, int[:] districts, int n_districts) except *:
+cpdef float equality(state, int[:] districts, int n_districts, DistrictStats stats=None) except *:
+    cdef float ideal_pop = float(state.population) / n_districts
+    cdef int[:] dist_populations
+    if stats is None:
+        dist_populations = district_populations(state, districts, n_districts)
+    else:
+        dist_populations = stats.populations
+    return equality_score(dist_populations, ideal_pop)
+
+cdef float equality_score(int[:] dist_populations, float ideal_pop) nogil:
     cdef int i
     cdef float d_score
     cdef float score = 0.0
-    cdef float ideal_pop = float(state.population) / n_districts
-    cdef int[:] dist_populations = district_populations(state, districts, n_districts)
-    for i in range(n_districts):
+    for i in range(dist_populations.shape[0]):
         d_score = fabs(dist_populations[i] - ideal_pop) / ideal_pop
         score = fmax(score, d_score)
     return fmin(score, 1.0)
@@ -0,0 +1 @@
+cdef float efficiency_gap_score(int[:, :] dist_voters, double population) nogil
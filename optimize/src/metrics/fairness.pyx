@@ -3,14 +3,19 @@
 # cython: initializedcheck=False
 # cython: nonecheck=False
 # cython: cdivision=True
-from libc.math cimport fmax, fmin
+from libc.math cimport fmax, fmin, fabs
 import numpy as np
 cimport numpy as np
 from src.districts cimport district_voters
+from src.district_stats cimport DistrictStats
 
-cpdef int[:, :] lost_votes(state, int[:] districts, int n_districts) except *:
+cpdef int[:, :] lost_votes(state, int[:] districts, int n_districts, DistrictStats stats=None) except *:
     # Helper for efficiency_gap
-    cdef int[:, :] dist_voters = district_voters(state, districts, n_districts)
+    cdef int[:, :] dist_voters
+    if stats is None:
+        dist_voters = district_voters(state, districts, n_districts)
+    else:
+        dist_voters = stats.voters
     cdef int[:, :] lost_votes  = np.zeros((n_districts, 2), dtype='i')
     cdef int di, avg_pop
     for di in range(n_districts):
@@ -23,23 +28,36 @@ cpdef int[:, :] lost_votes(state, int[:] districts, int n_districts) except *:
             lost_votes[di, 1] += dist_voters[di, 1] - avg_pop
     return lost_votes
 
-cpdef float efficiency_gap(state, int[:] districts, int n_districts) except *:
+cpdef float efficiency_gap(state, int[:] districts, int n_districts, DistrictStats stats=None) except *:
+    cdef int[:, :] dist_voters
+    if stats is None:
+        dist_voters = district_voters(state, districts, n_districts)
+    else:
+        dist_voters = stats.voters
+    return efficiency_gap_score(dist_voters, state.population)
+
+cdef float efficiency_gap_score(int[:, :] dist_voters, double population) nogil:
+    """ Same as summing lost_votes, without allocating it. """
     cdef float lost_a = 0
     cdef float lost_b = 0
-    cdef int[:,:] lv = lost_votes(state, districts, n_districts)
-    for di in range(n_districts):
-        lost_a += lv[di, 0]
-        lost_b += lv[di, 1]
-    cdef float score = abs(lost_a - lost_b) / state.population
-    return score
+    cdef int di, avg_pop
+    for di in range(dist_voters.shape[0]):
+        avg_pop = (dist_voters[di, 0] + dist_voters[di, 1]) // 2
+        if dist_voters[di,  0] > dist_voters[di, 1]:
+            lost_a += dist_voters[di, 0] - avg_pop
+            lost_b += dist_voters[di, 1]
+        else:
+            lost_a += dist_voters[di, 0]
+            lost_b += dist_voters[di, 1] - avg_pop
+    return fabs(lost_a - lost_b) / population
 
-def inefficiency_gap(state, districts, n_districts):
-    return 1.0 - efficiency_gap(state, districts, n_districts)
+def inefficiency_gap(state, districts, n_districts, stats=None):
+    return 1.0 - efficiency_gap(state, districts, n_districts, stats)
 
-def dem_advantage(state, districts, n_districts):
-    lv = np.array(lost_votes(state, districts, n_districts))
+def dem_advantage(state, districts, n_districts, stats=None):
+    lv = np.array(lost_votes(state, districts, n_districts, stats))
     return lv[:, 0].sum() / state.population # Count dem lost votes.
     
-def rep_advantage(state, districts, n_districts):
-    lv = np.array(lost_votes(state, districts, n_districts))
+def rep_advantage(state, districts, n_districts, stats=None):
+    lv = np.array(lost_votes(state, districts, n_districts, stats))
     return lv[:, 1].sum() / state.population # Count rep lost votes.
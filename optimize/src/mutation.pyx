@@ -3,33 +3,34 @@
 # cython: initializedcheck=False
 # cython: nonecheck=False
 # cython: cdivision=True
-import random
-from src.connectivity import can_lose
-from src.districts cimport district_populations, is_frontier
+import os, random
+import numpy as np
+cimport numpy as np
+from cython.parallel cimport prange, threadid
+from cpython.ref cimport PyObject
+from libc.stdlib cimport malloc, free
+from src.connectivity cimport Workspace
+from src.district_stats cimport DistrictStats
+from src.utils.random_x cimport random_below
 
-cpdef void mutate(
-    int[:] districts,
-    int n_districts,
-    state,
-    float m_rate,
-    int pop_min,
-    int pop_max
-) except *:
-    """ Mutate a partition.
+cdef int mutate_row(
+    int[:] districts, DistrictStats stats, Workspace workspace, int[:] indptr,
+    int[:] indices, int[:] tile_populations, int to_edit, int pop_min,
+    int pop_max, np.uint64_t *rng
+) nogil:
+    """ Move up to to_edit frontier tiles of one partition, drawing from rng.
+        Returns the number of tiles moved.
     """
     cdef int edits = 0
-    cdef int to_edit = max(1, int(m_rate * state.n_tiles))
     cdef int max_tries = 200
-    cdef int ti, tk, di, t_other, d_other
-    cdef list options
-    cdef bint is_front
-    cdef int[:] d_pop = district_populations(state, districts, n_districts)
-    cdef set front = set([ ti for ti in range(state.n_tiles) if is_frontier(districts, state, ti) ])
-    cdef int[:] tile_populations = state.tile_populations
-
+    cdef int ti, di, k, t_other, d_other, n_options, _
+    cdef int d_new = -1
+    cdef int[:] d_pop = stats.populations
     for _ in range(max_tries):
-        ### Pick random tile to change district. ###
-        ti = random.choice(tuple(front))
+        ### Pick random frontier tile to change district. ###
+        if stats.n_frontier == 0:
+            break
+        ti = stats.frontier_tiles[random_below(rng, stats.n_frontier)]
         di = districts[ti]
 
         ### See if removing will break population equality constraint. ###
@@ -37,31 +38,96 @@ cpdef void mutate(
             continue
 
         ### See if removing will break contiguity constraint. ###
-        if not can_lose(districts, state, n_districts, ti):
+        if not workspace._can_lose(districts, ti):
             continue
 
-        options = []
-        for t_other in state.tile_neighbors[ti]:
+        # Pick uniformly among the neighbors that can take ti.
+        n_options = 0
+        for k in range(indptr[ti], indptr[ti+1]):
+            t_other = indices[k]
             d_other = districts[t_other]
-            if districts[t_other] == districts[ti]:
+            if d_other == di:
                 continue
             if d_pop[d_other] + tile_populations[ti] > pop_max:
                 continue
+            n_options += 1
+            if random_below(rng, n_options) == 0:
+                d_new = d_other
 
-            options.append(t_other)
-
-        if len(options):
-            t_other = random.choice(options)
-            districts[ti] = districts[t_other]
-
-            for tk in state.tile_neighbors[ti]:
-                is_front = is_frontier(districts, state, tk)
-                if is_front:
-                    front.add(tk)
-                elif tk in front:
-                    front.remove(tk)
-
+        if n_options:
+            # Also updates the frontier.
+            stats._move(districts, ti, d_new)
             edits += 1
             if edits == to_edit:
                 break
-    return
+    return edits
+
+cpdef void mutate(
+    int[:] districts,
+    int n_districts,
+    state,
+    float m_rate,
+    int pop_min,
+    int pop_max,
+    DistrictStats stats=None,
+    Workspace workspace=None
+) except *:
+    """ Mutate a partition. stats, if given, is kept up to date with every
+        tile moved and tiles are sampled from its frontier, so a call costs
+        O(edits) rather than O(n_tiles). workspace is the connectivity
+        scratch to reuse. Draws its seed from the random module.
+    """
+    cdef int to_edit = max(1, int(m_rate * state.n_tiles))
+    cdef int[:] indptr = state.neighbors_indptr
+    cdef int[:] indices = state.neighbors_indices
+    cdef int[:] tile_populations = state.tile_populations
+    cdef np.uint64_t rng = random.getrandbits(64)
+    if stats is None:
+        stats = DistrictStats(state, districts, n_districts)
+    if workspace is None:
+        workspace = Workspace(state)
+    with nogil:
+        mutate_row(
+            districts, stats, workspace, indptr, indices, tile_populations,
+            to_edit, pop_min, pop_max, &rng
+        )
+
+def mutate_batch(
+    int[:, :] districts, int n_districts, state, float m_rate, int pop_min,
+    int pop_max, list stats, np.uint64_t[:] seeds, list workspaces=None,
+    n_threads=None
+):
+    """ Mutate every row of districts in parallel. stats holds the
+        DistrictStats of each row, kept up to date. Row i draws from its own
+        stream seeded by seeds[i], so the result does not depend on the
+        thread count. workspaces, one per thread, are made if not given.
+    """
+    cdef int n = districts.shape[0]
+    cdef int n_thread = n_threads or os.cpu_count() or 1
+    cdef int to_edit = max(1, int(m_rate * state.n_tiles))
+    cdef int[:] indptr = state.neighbors_indptr
+    cdef int[:] indices = state.neighbors_indices
+    cdef int[:] tile_populations = state.tile_populations
+    cdef np.uint64_t[:] rngs = np.array(seeds, dtype='u8')
+    cdef int i
+    assert len(stats) == n and all(isinstance(s, DistrictStats) for s in stats)
+    if workspaces is None or len(workspaces) < n_thread:
+        workspaces = [ Workspace(state) for _ in range(n_thread) ]
+    assert all(isinstance(w, Workspace) for w in workspaces)
+    # Borrowed references, kept alive by the lists.
+    cdef PyObject **stats_ptrs = <PyObject **>malloc(n * sizeof(PyObject *))
+    cdef PyObject **workspace_ptrs = <PyObject **>malloc(n_thread * sizeof(PyObject *))
+    for i in range(n):
+        stats_ptrs[i] = <PyObject *>stats[i]
+    for i in range(n_thread):
+        workspace_ptrs[i] = <PyObject *>workspaces[i]
+    try:
+        for i in prange(n, nogil=True, schedule='dynamic', num_threads=n_thread):
+            mutate_row(
+                districts[i], <DistrictStats>stats_ptrs[i],
+                <Workspace>workspace_ptrs[threadid()], indptr, indices,
+                tile_populations, to_edit, pop_min, pop_max, &rngs[i]
+            )
+    finally:
+        free(stats_ptrs)
+        free(workspace_ptrs)
@@ -73,7 +73,8 @@ class EdgesHistogramNoveltyArchive(NoveltyArchive):
         districts = np.array(districts, dtype='i')
         return edges_histograms( 
             districts, self.n_districts, self.bins, self.n_pairs, 
-            self.state.tile_centers, self.state.tile_neighbors
+            self.state.tile_centers, self.state.neighbors_indptr,
+            self.state.neighbors_indices
         )
 
 class CentersHistogramNoveltyArchive(NoveltyArchive):
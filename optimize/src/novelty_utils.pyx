@@ -14,7 +14,7 @@ cdef int rand_int(int min, int max):
     """ Fast cython randint """
     return int(min + (rand()/float(RAND_MAX)) * (max - min))
 
-cdef inline float udist(float[:] a, float[:] b):
+cdef inline float udist(float[:] a, float[:] b) nogil:
     """ Euclidian distance between two 2D vectors. Faster than np.linalg.norm. """
     cdef float x = a[0] - b[0]
     cdef float y = a[1] - b[1]
@@ -72,27 +72,30 @@ cpdef list centers_histograms(int[:,:] districts, int n_districts, int bins, flo
 
 cpdef list edges_histograms(
     int[:, :] districts, int n_districts, int bins, int n,
-    float[:,:] tile_centers, list tile_neighbors
+    float[:,:] tile_centers, int[:] indptr, int[:] indices
 ):
-    """ Histogram of distances between tiles within the same district. """
-    cdef int i, j, ti, di, tj, n_edge_tiles
-    cdef list district_tis
+    """ Histogram of distances between tiles within the same district.
+        indptr and indices are the CSR adjacency of the state.
+    """
+    cdef int i, j, k, ti, di, tj, n_edge_tiles
     cdef list result = []
     cdef int n_tiles = districts.shape[1]
     cdef float[:] values = np.zeros(n, dtype='f')
+    cdef int[:] edge_tiles = np.zeros(n_tiles, dtype='i')
     for i in range(districts.shape[0]):
-        edge_tiles = []
-        values[:] = 0.0
-        for ti in range(n_tiles):
-            di = districts[i, ti]
-            for tj in tile_neighbors[ti]:
-                if di != districts[i, tj]:
-                    edge_tiles.append(ti)
-                    break
-        n_edge_tiles = len(edge_tiles)
-        for j in range(n):
-            ti = rand() % n_edge_tiles
-            tj = rand() % n_edge_tiles
-            values[j] = udist(tile_centers[ti], tile_centers[tj])
+        with nogil:
+            n_edge_tiles = 0
+            values[:] = 0.0
+            for ti in range(n_tiles):
+                di = districts[i, ti]
+                for k in range(indptr[ti], indptr[ti+1]):
+                    if di != districts[i, indices[k]]:
+                        edge_tiles[n_edge_tiles] = ti
+                        n_edge_tiles += 1
+                        break
+            for j in range(n):
+                ti = rand() % n_edge_tiles
+                tj = rand() % n_edge_tiles
+                values[j] = udist(tile_centers[ti], tile_centers[tj])
         result.append(np.histogram(values, bins=bins, density=True)[0])
     return result
@@ -16,6 +16,7 @@ from pymoo.algorithms.nsga3 import NSGA3
 from src import districts, metrics, mutation, novelty
 from src.state import State
 from src.constraints import fix_pop_equality
+from src.contraction_cache import load_or_contract
 # from src.novelty import DistrictHistogramNoveltyArchive as NoveltyArchive
 from src.feasibleinfeasible import *
 from src.optimize_utils import *
@@ -30,15 +31,11 @@ def optimize(config):
         assert config.novelty is not None, 'Must set a novelty method for feasinfeas_2N'
     assert config.novelty is False or config.novelty in novelty.archives, 'Novelty method does not exist:'+config.novelty
     feasinfeas = bool(config.feasinfeas) or bool(config.feasinfeas_2N)
+    assert not (feasinfeas and config.islands > 1), 'Islands are not supported with feasinfeas'
     if config.out is not None:
         os.makedirs(config.out, exist_ok=False)
     for k, v in vars(config).items():
         if k[0] != '_': print(f'{k}: {v}')
-    original_state = State.fromFile(config.state)
-    original_state = original_state.mergeIslands()[0]
-    if config.seed is not None:
-        random.seed(config.seed)
-        np.random.seed(config.seed)
     # for metric_name, limit, in config.metrics:
     #     assert (type(limit) is float and 0 <= limit <= 1), F'{limit} is not a number.' 
     #     assert hasattr(metrics, metric_name), F'{metric_name} is not a metric.' 
@@ -47,14 +44,12 @@ def optimize(config):
     # The core of the code. First, contract the state graph.
     #---------------------------------------------------------------------------
     print('Subdividing State:')
-    states = [ original_state ]
-    mappings = [ None ]
-    while states[-1].n_tiles > config.max_start_tiles:
-        state, mapping = states[-1].contract()
-        states.append(state)
-        mappings.append(mapping)
-    states = states[::-1]
-    mappings = mappings[::-1]
+    states, mappings = load_or_contract(
+        config.state, config.max_start_tiles, config.seed, config.contraction_cache
+    )
+    if config.seed is not None:
+        random.seed(config.seed)
+        np.random.seed(config.seed)
     #---------------------------------------------------------------------------
     # Second, Create an initial population that has populaiton equality.
     #---------------------------------------------------------------------------
@@ -119,6 +114,8 @@ def optimize(config):
         print(f'\tNum tiles: {state.n_tiles}')
         last_phase = opt_i == len(states)-1
         OPT = run_fi if feasinfeas else run_optimization
+        if config.islands > 1:
+            OPT = run_island_optimization
         result, hv_history = OPT(ALG, state, used_metrics, used_constraints,
                                  seeds, config, n_gens, opt_i)
         hv_histories.append(hv_history)
@@ -1,4 +1,4 @@
-import os, random, time, json
+import os, random, time, json, multiprocessing
 import numpy as np
 from functools import partial
 try:
@@ -10,49 +10,153 @@ from copy import copy
 from pymoo.model.problem import Problem
 from pymoo.model.mutation import Mutation
 from pymoo.model.crossover import Crossover
+from pymoo.model.evaluator import Evaluator
+from pymoo.model.population import Population
+from pymoo.model.result import Result
+from pymoo.model.algorithm import filter_optimum
 from pymoo.performance_indicator.hv import Hypervolume
 from pymoo.algorithms.nsga2 import NSGA2
 from pymoo.algorithms.nsga3 import NSGA3
-from src import districts, metrics, mutation, novelty
+from src import districts, metrics, mutation, novelty, evaluate, recom
 from src.state import State
+from src.district_stats import DistrictStats
 from src.constraints import fix_pop_equality
+from src.connectivity import Workspace
+from src.eval_cache import EvalCache
 from src.feasibleinfeasible import *
 # from src.novelty import EdgesHistogramNoveltyArchive, CentersHistogramNoveltyArchive, MutualTilesNoveltyArchive
 
 ############################################################################
 # Evolutionary Operators.
 ############################################################################
+def copy_stats(stats):
+    return [ None if s is None else s.copy() for s in stats ]
+
 class DistrictCross(Crossover):
     """ The crossover operator does nothing.
     """
     def __init__(self, **kwargs):
         super().__init__(n_parents=2, n_offsprings=2, **kwargs)
+    def do(self, problem, pop, parents, **kwargs):
+        off = super().do(problem, pop, parents, **kwargs)
+        # Offspring are copies of their parents, so are their stats.
+        off.set('stats', copy_stats(pop.get('stats')[parents.T].reshape(-1)))
+        return off
     def _do(self, problem, X, **kwargs):
         return X.copy()
 
+class RecomCrossover(DistrictCross):
+    """ Each child is a copy of one parent with two adjacent districts
+        merged and re-split along a random spanning tree that follows the
+        other parent's district borders, so it keeps contiguity and stays
+        within the population tolerance. Children whose recombination fails
+        stay copies.
+    """
+    def __init__(self, state, n_districts, tolerance=.15, n_threads=None, **kwargs):
+        super().__init__(**kwargs)
+        self.state = state
+        self.n_districts = n_districts
+        ideal_pop = state.population / n_districts
+        self.pop_max = ideal_pop * (1 + tolerance)
+        self.pop_min = ideal_pop * (1 - tolerance)
+        self.n_threads = n_threads or os.cpu_count() or 1
+        self.workspaces = [ recom.TreeWorkspace(state) for _ in range(self.n_threads) ]
+
+    def do(self, problem, pop, parents, **kwargs):
+        pop_X = pop.get('X')
+        X = pop_X[parents.T].reshape(-1, pop_X.shape[1])
+        guides = pop_X[parents[:, ::-1].T].reshape(-1, pop_X.shape[1])
+        stats = copy_stats(pop.get('stats')[parents.T].reshape(-1))
+        rows = np.where(np.tile(np.random.random(len(parents)) < self.prob, self.n_offsprings))[0]
+        for i in rows:
+            if stats[i] is None:
+                stats[i] = DistrictStats(self.state, X[i], self.n_districts)
+        seeds = np.random.randint(0, 2**63, size=len(rows), dtype='u8')
+        X_rows = X[rows]
+        recom.recombine_batch(
+            X_rows, guides[rows], self.state, self.pop_min, self.pop_max,
+            [ stats[i] for i in rows ], seeds, self.workspaces,
+            n_threads=self.n_threads
+        )
+        X[rows] = X_rows
+        return pop.new('X', X, 'stats', stats)
+
+def make_crossover(state, config, tolerance, n_threads=None):
+    """ The crossover named by config.crossover. """
+    if config.crossover == 'recom':
+        return RecomCrossover(state, config.n_districts, tolerance, n_threads)
+    return DistrictCross()
+
 class DistrictMutation(Mutation):
     """ Mutate the districts while preserving the population equality.
+        Rows are mutated in parallel, each from its own seed drawn from
+        numpy's global generator. mode 'flip' moves single frontier tiles,
+        'recom' merges two adjacent districts and re-splits them along a
+        random spanning tree.
     """
-    def __init__(self, state, n_districts, tolerance=.15):
+    def __init__(self, state, n_districts, tolerance=.15, n_threads=None, mode='flip'):
         super().__init__()
+        assert mode in ('flip', 'recom')
         self.state = state
         self.n_districts = n_districts
+        self.mode = mode
         ideal_pop = state.population / n_districts
         self.pop_max = ideal_pop * (1 + tolerance)
         self.pop_min = ideal_pop * (1 - tolerance)
+        self.n_threads = n_threads or os.cpu_count() or 1
+        if mode == 'recom':
+            self.workspaces = [ recom.TreeWorkspace(state) for _ in range(self.n_threads) ]
+        else:
+            self.workspaces = [ Workspace(state) for _ in range(self.n_threads) ]
+
+    def do(self, problem, pop, **kwargs):
+        X = pop.get('X').copy()
+        stats = copy_stats(pop.get('stats'))
+        self._mutate(X, stats)
+        return pop.new('X', X, 'stats', stats)
 
     def _do(self, problem, X, **kwargs):
         X = X.copy()
+        self._mutate(X, [ None ] * X.shape[0])
+        return X
+
+    def _mutate(self, X, stats):
         mutation_rate = 1.0 / self.state.n_tiles
         for i in range(X.shape[0]):
-            mutation.mutate(X[i], self.n_districts, self.state, mutation_rate, self.pop_min, self.pop_max)
-        return X
+            if stats[i] is None:
+                stats[i] = DistrictStats(self.state, X[i], self.n_districts)
+        seeds = np.random.randint(0, 2**63, size=X.shape[0], dtype='u8')
+        if self.mode == 'recom':
+            recom.recombine_batch(X, None, self.state, self.pop_min, self.pop_max,
+                                  stats, seeds, self.workspaces, n_threads=self.n_threads)
+        else:
+            mutation.mutate_batch(X, self.n_districts, self.state, mutation_rate,
+                                  self.pop_min, self.pop_max, stats, seeds,
+                                  self.workspaces, self.n_threads)
+
+class DistrictEvaluator(Evaluator):
+    """ Passes the DistrictStats of each individual to the problem, creating
+        them for individuals without any (e.g. the initial population).
+    """
+    def __init__(self, state, n_districts, **kwargs):
+        super().__init__(**kwargs)
+        self.state = state
+        self.n_districts = n_districts
+
+    def _eval(self, problem, pop, **kwargs):
+        X = pop.get('X')
+        stats = list(pop.get('stats'))
+        for i in range(len(pop)):
+            if stats[i] is None:
+                stats[i] = DistrictStats(self.state, X[i], self.n_districts)
+        pop.set('stats', stats)
+        super()._eval(problem, pop, stats=stats, **kwargs)
 
 class DistrictProblem(Problem):
     """ This class just calls the objective functions.
     """
     def __init__( self, state, n_iters, config, used_metrics,
-                  used_constraints=[], *args, **kwargs ):
+                  used_constraints=[], n_threads=None, *args, **kwargs ):
         super().__init__(
             n_var=state.n_tiles,
             n_obj=len(used_metrics)+bool(config.novelty),
@@ -63,23 +167,28 @@ class DistrictProblem(Problem):
         self.n_districts = config.n_districts
         self.used_metrics = used_metrics
         self.used_constraints = used_constraints
+        self.batch = batch_spec(used_metrics, used_constraints)
+        self.n_threads = n_threads
+        self.cache = EvalCache(config.eval_cache) if config.eval_cache else None
+        self.workers = None
+        if config.eval_workers > 1:
+            self.workers = EvalWorkers(
+                state, self.n_districts, used_metrics, used_constraints,
+                self.batch, config.eval_workers
+            )
         self.novelty = config.novelty
         if self.novelty:
             print('Making novelty archive...')
             arch = novelty.archives[self.novelty]
             self.archive = arch(state, self.n_districts, **config.nov_params)
 
-    def _evaluate(self, districts, out, *args, **kwargs):
-        state, n_districts, = self.state, self.n_districts
-        out['F'] = np.array([
-            [ f(state, d, n_districts) for f in self.used_metrics ]
-            for d in districts
-        ])
+    def _evaluate(self, districts, out, *args, stats=None, **kwargs):
+        if self.cache is None:
+            out['F'], G = self._score(districts, stats)
+        else:
+            out['F'], G = self._score_cached(districts, stats)
         if self.used_constraints:
-            out['G'] = np.zeros((districts.shape[0], self.n_constr))
-            for di, d in enumerate(districts):
-                for ci, c in enumerate(self.used_constraints):
-                    out['G'][di, ci] = c(state, d, n_districts, out['F'][di])
+            out['G'] = G
         if self.novelty:
             novelty = self.archive.updateAndGetNovelty(districts)
             novelty = 1.0 - novelty
@@ -88,6 +197,109 @@ class DistrictProblem(Problem):
         assert out['F'].min() >= 0
         assert out['F'].max() <= 1.0
 
+    def _score(self, districts, stats):
+        """ Returns the metric and constraint values (F, G) of each row. """
+        if self.workers is not None:
+            return self.workers.score(districts)
+        return score(
+            self.state, self.n_districts, self.used_metrics,
+            self.used_constraints, self.batch, districts, stats, self.n_threads
+        )
+
+    def _score_cached(self, districts, stats):
+        """ _score that only scores partitions not in the cache, once each. """
+        keys = self.cache.keys(districts, self.n_districts)
+        F = np.zeros((districts.shape[0], len(self.used_metrics)))
+        G = np.zeros((districts.shape[0], len(self.used_constraints)))
+        todo = {}
+        for i, key in enumerate(keys):
+            value = self.cache.get(key)
+            if value is not None:
+                F[i], G[i] = value
+            else:
+                todo.setdefault(key, []).append(i)
+        if todo:
+            rows = [ idxs[0] for idxs in todo.values() ]
+            F_new, G_new = self._score(
+                districts[rows], None if stats is None else [ stats[i] for i in rows ]
+            )
+            for (key, idxs), f, g in zip(todo.items(), F_new, G_new):
+                F[idxs], G[idxs] = f, g
+                self.cache.put(key, f, g)
+        return F, G
+
+    def close(self):
+        """ Stop the evaluation workers, if any. """
+        if self.workers is not None:
+            self.workers.close()
+            self.workers = None
+
+def score(state, n_districts, used_metrics, used_constraints, batch, districts,
+          stats=None, n_threads=None):
+    """ Returns the metric and constraint values (F, G) of each row of
+        districts, with evaluate_batch when batch (see batch_spec) is given and
+        else by calling each metric and constraint per row.
+    """
+    if batch is not None:
+        names, constraint_names, thresholds = batch
+        return evaluate.evaluate_batch(
+            state, np.ascontiguousarray(districts, dtype='i'), n_districts,
+            names, constraint_names, thresholds,
+            None if stats is None else list(stats), n_threads
+        )
+    if stats is None:
+        stats = [ DistrictStats(state, d, n_districts) for d in districts ]
+    F = np.array([
+        [ f(state, d, n_districts, stats=s) for f in used_metrics ]
+        for d, s in zip(districts, stats)
+    ]).reshape(districts.shape[0], len(used_metrics))
+    G = np.zeros((districts.shape[0], len(used_constraints)))
+    for di, (d, s) in enumerate(zip(districts, stats)):
+        for ci, c in enumerate(used_constraints):
+            G[di, ci] = c(state, d, n_districts, F[di], stats=s)
+    return F, G
+
+def share_state(state, batch):
+    """ state.toShared(), with the lazy arrays that batch needs computed first
+        so every process does not compute its own.
+    """
+    if batch is not None and ('convex_hull' in batch[0] + batch[1] or 'reock' in batch[0] + batch[1]):
+        state.tile_hull_points
+    return state.toShared()
+
+# Set in each evaluation worker by _init_eval_worker.
+_eval_worker_args = None
+
+def _init_eval_worker(shared_state, n_districts, used_metrics, used_constraints, batch):
+    global _eval_worker_args
+    state = State.fromShared(*shared_state)
+    _eval_worker_args = (state, n_districts, used_metrics, used_constraints, batch)
+
+def _score_rows(districts):
+    # Workers are the parallelism, so evaluate_batch uses one thread.
+    return score(*_eval_worker_args, districts, n_threads=1)
+
+class EvalWorkers:
+    """ A pool of persistent processes scoring partitions. The state arrays are
+        put in shared memory and its scalars pickled once per worker, so tasks
+        only send partition rows and their F and G values.
+    """
+    def __init__(self, state, n_districts, used_metrics, used_constraints, batch, n_workers):
+        self.n_workers = n_workers
+        self.pool = multiprocessing.Pool(
+            n_workers, initializer=_init_eval_worker,
+            initargs=(share_state(state, batch), n_districts, used_metrics, used_constraints, batch)
+        )
+
+    def score(self, districts):
+        """ (F, G) of each row of districts, split evenly between workers. """
+        chunks = [ c for c in np.array_split(districts, self.n_workers) if len(c) ]
+        results = self.pool.map(_score_rows, chunks)
+        return np.concatenate([ F for F, _ in results ]), np.concatenate([ G for _, G in results ])
+
+    def close(self):
+        self.pool.terminate()
+
 class DistrictProblemFI(FI_problem_mixin, DistrictProblem):
     pass
 
@@ -109,6 +321,7 @@ def minimize(problem, algorithm,termination=None,**kwargs):
 ################################################################################
 def save_results(config, state, result, opt_i, hv_history):
     """ Save all the results and config to disk. """
+    opt_stats = result.opt.get('stats') if result.opt is not None else [ None ] * len(result.X)
     with open(os.path.join(config.out, 'config.json'), 'w') as f:
         json.dump(vars(config), f, indent=4)
     with open(os.path.join(config.out, 'state_%i.json'%opt_i), 'w') as f:
@@ -127,8 +340,8 @@ def save_results(config, state, result, opt_i, hv_history):
                     for x in result.X
                 ],
                 'bounding_hulls': [
-                    metrics.bounding_hulls(state, x, config.n_districts)
-                    for x in result.X
+                    metrics.bounding_hulls(state, x, config.n_districts, s)
+                    for x, s in zip(result.X, opt_stats)
                 ]
             }
         }, f)
@@ -149,14 +362,37 @@ def upscale(districts, mapping):
             upscaled[i, j] = districts[i, mapping[j]]
     return upscaled
 
-def equality_constraint(state, district, n_districts, values, threshold):
+def equality_constraint(state, district, n_districts, values, threshold, stats=None):
     """ Return if it violates constraint """ 
-    return metrics.equality(state, district, n_districts) > threshold
+    return metrics.equality(state, district, n_districts, stats) > threshold
 
-def value_constraint(state, district, n_districts, values, index, threshold):
+def value_constraint(state, district, n_districts, values, index, threshold, stats=None):
     """ Return if it violates constraint """ 
     return values[index] > threshold
 
+def batch_spec(used_metrics, used_constraints):
+    """ Describe the metrics and constraints for evaluate.evaluate_batch, as
+        (metric names, constraint metric names, thresholds). None if any of
+        them has no batched version.
+    """
+    names = [ getattr(f, 'func', f).__name__ for f in used_metrics ]
+    if any(isinstance(f, partial) and (f.args or f.keywords) for f in used_metrics):
+        return None
+    constraint_names, thresholds = [], []
+    for c in used_constraints:
+        if not isinstance(c, partial):
+            return None
+        elif c.func is equality_constraint:
+            constraint_names.append('equality')
+        elif c.func is value_constraint:
+            constraint_names.append(names[c.keywords['index']])
+        else:
+            return None
+        thresholds.append(c.keywords['threshold'])
+    if not all(name in evaluate.METRICS for name in names + constraint_names):
+        return None
+    return names, constraint_names, np.array(thresholds)
+
 def opt_callback(algorithm, text, pbar, HV, hypervolume_mask):
     """ A logging function passed as the 'callback' to the algorithm """
     F = algorithm.pop.get("F")
@@ -180,29 +416,78 @@ def opt_callback(algorithm, text, pbar, HV, hypervolume_mask):
     # algorithm.pf_size_history.append(pf_size)
     
     pbar.update(1)
-    pbar.set_description(f"{text}: {hv} {F.shape[0]}")
+    description = f"{text}: {hv} {F.shape[0]}"
+    if algorithm.problem.cache is not None:
+        description += ' ' + algorithm.problem.cache.summary()
+    pbar.set_description(description)
+
+# Set in each seed worker by _init_seed_worker, so the state is sent once per
+# worker (or inherited when forked) rather than with every task.
+_seed_worker_args = None
+
+def _init_seed_worker(state, config, max_iters, base_seed):
+    global _seed_worker_args
+    _seed_worker_args = (state, config, max_iters, base_seed)
+
+def _make_seed(task):
+    """ Make seed number task, with the random stream seeded from it so the
+        result does not depend on which worker runs it. Returns (task,
+        partition or None on failure).
+    """
+    state, config, max_iters, base_seed = _seed_worker_args
+    random.seed(base_seed + task)
+    try:
+        rand_dist = districts.make_random(state, config.n_districts)
+        if not config.dont_fix_seeds and config.equality_constraint > 0:
+            fix_pop_equality(
+                state, rand_dist, config.n_districts,
+                tolerance=config.equality_constraint,
+                max_iters=max_iters
+            )
+        return task, rand_dist
+    except ValueError:
+        return task, None
 
 def feasible_seeds(state, config, max_iters=400):
+    """ Make config.pop_size random partitions, fixed for population equality
+        unless config.dont_fix_seeds, over config.n_workers processes (one if
+        unset). Gives up after 2*pop_size failures in total.
+    """
     seeds = []
     n_failures = 0
     allowed_failures = 2*config.pop_size
-    with tqdm(total=config.pop_size) as pbar:
-        while len(seeds) < config.pop_size:
-            try:
-                rand_dist = districts.make_random(state, config.n_districts)
-                if not config.dont_fix_seeds and config.equality_constraint > 0:
-                    fix_pop_equality(
-                        state, rand_dist, config.n_districts,
-                        tolerance=config.equality_constraint,
-                        max_iters=max_iters
-                    )
-                seeds.append(rand_dist)
-                pbar.update(1)
-            except Exception as e:
-                n_failures += 1
-                if n_failures == allowed_failures:
-                    raise ValueError('Too many failures in fix_seeds')
-    return seeds
+    base_seed = random.getrandbits(32)
+    n_workers = config.n_workers or 1
+    next_task = 0
+    pool = None
+    if n_workers > 1:
+        pool = multiprocessing.Pool(
+            n_workers, initializer=_init_seed_worker,
+            initargs=(state, config, max_iters, base_seed)
+        )
+        run = partial(pool.imap_unordered, _make_seed, chunksize=4)
+    else:
+        _init_seed_worker(state, config, max_iters, base_seed)
+        run = partial(map, _make_seed)
+    try:
+        with tqdm(total=config.pop_size) as pbar:
+            while len(seeds) < config.pop_size:
+                # Each round makes just enough seeds to replace the failures.
+                n_tasks = config.pop_size - len(seeds)
+                tasks = range(next_task, next_task + n_tasks)
+                next_task += n_tasks
+                for task, rand_dist in run(tasks):
+                    if rand_dist is None:
+                        n_failures += 1
+                        if n_failures == allowed_failures:
+                            raise ValueError('Too many failures in fix_seeds')
+                    else:
+                        seeds.append((task, rand_dist))
+                        pbar.update(1)
+    finally:
+        if pool is not None:
+            pool.terminate()
+    return [ rand_dist for _, rand_dist in sorted(seeds, key=lambda s: s[0]) ]
 
 def run_fi_optimization(ALG, state, metrics, constraints, seeds, config, n_gens, opt_i, feas_mask, infeas_mask):
     """ Run one optimziation phase with feasible-infeasible method. """
@@ -211,8 +496,8 @@ def run_fi_optimization(ALG, state, metrics, constraints, seeds, config, n_gens,
     feas_algo = NSGA2_FI(
         pop_size=pop_size,
         sampling=seeds[:pop_size] if opt_i == 0 else seeds,
-        mutation=DistrictMutation(state, config.n_districts, config.equality_constraint),
-        crossover=DistrictCross(),
+        mutation=DistrictMutation(state, config.n_districts, config.equality_constraint, mode=config.mutation),
+        crossover=make_crossover(state, config, config.equality_constraint),
         callback=partial(
             opt_callback,
             text='  Feas HV',
@@ -226,8 +511,8 @@ def run_fi_optimization(ALG, state, metrics, constraints, seeds, config, n_gens,
     infeas_algo = NSGA2_FI(
         pop_size=pop_size,
         sampling=seeds[pop_size:] if opt_i == 0 else seeds,
-        crossover=DistrictCross(),
-        mutation=DistrictMutation(state, config.n_districts, 1.0),
+        crossover=make_crossover(state, config, 1.0),
+        mutation=DistrictMutation(state, config.n_districts, 1.0, mode=config.mutation),
         selection=TournamentSelection(func_comp=cv_agnostic_binary_tournament),
         callback=partial(
             opt_callback,
@@ -242,13 +527,17 @@ def run_fi_optimization(ALG, state, metrics, constraints, seeds, config, n_gens,
         used_metrics=metrics,
         used_constraints=constraints
     )
-    result = FI_minimize(
-        problem, feas_algo, infeas_algo, ('n_gen', n_gens),
-        feas_mask=feas_mask,
-        infeas_mask=infeas_mask,
-        verbose=False,
-        seed=0
-    )
+    try:
+        result = FI_minimize(
+            problem, feas_algo, infeas_algo, ('n_gen', n_gens),
+            feas_mask=feas_mask,
+            infeas_mask=infeas_mask,
+            verbose=False,
+            seed=0,
+            evaluator=DistrictEvaluator(state, config.n_districts)
+        )
+    finally:
+        problem.close()
     # print('final', result.F.sum(axis=0))
     return result, feas_algo.hv_history#, feas_algo.pf_size_history
 
@@ -258,8 +547,8 @@ def run_optimization(ALG, state, metrics, constraints, seeds, config, n_gens, op
     algorithm = ALG(
         pop_size=config.pop_size,
         sampling=seeds,
-        crossover=DistrictCross(),
-        mutation=DistrictMutation(state, config.n_districts, config.equality_constraint),
+        crossover=make_crossover(state, config, config.equality_constraint),
+        mutation=DistrictMutation(state, config.n_districts, config.equality_constraint, mode=config.mutation),
         callback=partial(
             opt_callback,
             text='HV', 
@@ -275,13 +564,177 @@ def run_optimization(ALG, state, metrics, constraints, seeds, config, n_gens, op
         used_metrics=metrics,
         used_constraints=constraints
     )
-    result = minimize(
-        problem, algorithm, ('n_gen', n_gens),
-        seed=0, verbose=False, save_history=False
-    )
+    try:
+        result = minimize(
+            problem, algorithm, ('n_gen', n_gens),
+            seed=0, verbose=False, save_history=False,
+            evaluator=DistrictEvaluator(state, config.n_districts)
+        )
+    finally:
+        problem.close()
     # print(algorithm.pop.get('X').shape)
     #result.F = result.F[:, mask]
     # result.X = algorithm.pop.get('X')
     # result.F = algorithm.pop.get('F')
     # print('Finished optimization', result.F.shape)
     return result, algorithm.hv_history#, algorithm.pf_size_history
+
+################################################################################
+# Island model.
+################################################################################
+def island_callback(algorithm, hypervolume_mask):
+    """ Records the objectives used for hypervolume each generation, for the
+        main process to merge across islands.
+    """
+    algorithm.front_history.append(algorithm.pop.get('F')[:, hypervolume_mask])
+
+def emigrants(algorithm, n):
+    """ Up to n random feasible non-dominated plans of an island. """
+    opt = algorithm.opt
+    if opt is None or len(opt) == 0:
+        return np.empty((0, algorithm.problem.n_var), dtype='i')
+    X = opt.get('X')[opt.get('feasible')[:, 0]]
+    return X[np.random.permutation(len(X))[:n]]
+
+def immigrate(algorithm, X):
+    """ Evaluate the plans of X not already in the population and let them
+        compete with it in survival.
+    """
+    off = algorithm.eliminate_duplicates.do(algorithm.pop.new('X', X), algorithm.pop)
+    if len(off) == 0:
+        return
+    algorithm.evaluator.eval(algorithm.problem, off, algorithm=algorithm)
+    algorithm.pop = algorithm.survival.do(
+        algorithm.problem, algorithm.pop.merge(off), algorithm.pop_size,
+        algorithm=algorithm
+    )
+    algorithm._set_optimum()
+
+def _run_island(conn, shared_state, ALG, metrics, constraints, seeds, config,
+                n_gens, seed, n_threads):
+    """ The process of one island. Each message from conn is either
+        (n_gens, immigrants), answered with (emigrants, objectives used for
+        hypervolume each generation) after taking in the immigrants and
+        running n_gens more generations, or None, answered with the final
+        population.
+    """
+    random.seed(seed)
+    state = State.fromShared(*shared_state)
+    mask = [ True ] * len(metrics) + ([ False ] if config.novelty else [])
+    algorithm = ALG(
+        pop_size=len(seeds),
+        sampling=seeds,
+        crossover=make_crossover(state, config, config.equality_constraint, n_threads),
+        mutation=DistrictMutation(state, config.n_districts, config.equality_constraint,
+                                  n_threads, mode=config.mutation),
+        callback=partial(island_callback, hypervolume_mask=mask),
+    )
+    problem = DistrictProblem(
+        state, n_gens, config,
+        used_metrics=metrics,
+        used_constraints=constraints,
+        n_threads=n_threads
+    )
+    algorithm.initialize(
+        problem, termination=get_termination('n_gen', n_gens), seed=seed,
+        evaluator=DistrictEvaluator(state, config.n_districts)
+    )
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        n_epoch, immigrants = message
+        if immigrants is not None and len(immigrants):
+            immigrate(algorithm, immigrants)
+        algorithm.front_history = []
+        for _ in range(n_epoch):
+            if algorithm.n_gen is None:
+                # The initial population, as in Algorithm._solve.
+                algorithm.n_gen = 1
+                algorithm._initialize()
+                algorithm._set_optimum()
+                algorithm._each_iteration()
+            else:
+                algorithm.next()
+        conn.send((emigrants(algorithm, config.migrants), algorithm.front_history))
+    conn.send(algorithm.pop.get('X', 'F', 'CV', 'G', 'feasible'))
+    problem.close()
+
+def _island_reply(conn, island_i):
+    try:
+        return conn.recv()
+    except EOFError:
+        raise RuntimeError('Island %i stopped' % island_i)
+
+def run_island_optimization(ALG, state, metrics, constraints, seeds, config, n_gens, opt_i):
+    """ run_optimization with the seeds split between config.islands
+        populations, each evolved in its own process. Every
+        config.migration_interval generations each island sends up to
+        config.migrants of its non-dominated plans to the next island in a
+        ring. The result's population is that of all islands and its optimum
+        their merged Pareto front. The hypervolume history is of all islands'
+        populations together.
+    """
+    n_islands = min(config.islands, len(seeds))
+    mask = [ True ] * len(metrics) + ([ False ] if config.novelty else [])
+    HV = Hypervolume(ref_point=np.ones(sum(mask)))
+    print('Run island optimization', len(seeds), n_islands)
+    # The islands are the parallelism, so they share the cores.
+    n_threads = max(1, (os.cpu_count() or 1) // n_islands)
+    island_config = copy(config)
+    island_config.eval_workers = 0
+    shared_state = share_state(state, batch_spec(metrics, constraints))
+    base_seed = random.getrandbits(32)
+    conns, islands = [], []
+    try:
+        for i in range(n_islands):
+            conn, island_conn = multiprocessing.Pipe()
+            island = multiprocessing.Process(
+                target=_run_island, daemon=True,
+                args=(island_conn, shared_state, ALG, metrics, constraints,
+                      seeds[i::n_islands], island_config, n_gens,
+                      (base_seed + i) % 2**32, n_threads)
+            )
+            island.start()
+            conns.append(conn)
+            islands.append(island)
+
+        hv_history = []
+        migrants = [ None ] * n_islands
+        with tqdm(total=n_gens) as pbar:
+            while len(hv_history) < n_gens:
+                n_epoch = min(config.migration_interval, n_gens - len(hv_history))
+                for conn, immigrants in zip(conns, migrants):
+                    conn.send((n_epoch, immigrants))
+                replies = [ _island_reply(conn, i) for i, conn in enumerate(conns) ]
+                # Island i takes in the emigrants of island i-1.
+                migrants = [ replies[i-1][0] for i in range(n_islands) ]
+                for fronts in zip(*[ history for _, history in replies ]):
+                    hv_history.append(round(HV.calc(np.concatenate(fronts)), 5))
+                pbar.update(n_epoch)
+                pbar.set_description(f"HV: {hv_history[-1]} {n_islands} islands")
+
+        pop = Population()
+        for i, conn in enumerate(conns):
+            conn.send(None)
+            X, F, CV, G, feasible = _island_reply(conn, i)
+            pop = pop.merge(Population().new(
+                'X', X, 'F', F, 'CV', CV, 'G', G, 'feasible', feasible
+            ))
+        for island in islands:
+            island.join()
+    finally:
+        for island in islands:
+            if island.is_alive():
+                island.terminate()
+
+    # The merged optimum, as in Algorithm.solve.
+    result = Result()
+    result.pop = pop
+    result.opt = filter_optimum(pop, least_infeasible=True)
+    if result.opt is None or not np.any(result.opt.get('feasible')):
+        result.opt = None
+        result.X, result.F, result.CV, result.G = None, None, None, None
+    else:
+        result.X, result.F, result.CV, result.G = result.opt.get('X', 'F', 'CV', 'G')
+    return result, hv_history
@@ -0,0 +1,29 @@
+cimport numpy as np
+from src.district_stats cimport DistrictStats
+
+cdef class TreeWorkspace:
+    cdef int[:] indptr, indices, tile_populations
+    cdef np.uint8_t[:] mark
+    cdef int[:] order, parent
+    cdef np.int64_t[:] subtree_pop
+    # Min heap of the edges leaving the tree.
+    cdef int n_heap
+    cdef double[:] heap_keys
+    cdef int[:] heap_tails, heap_heads
+
+    cdef void _push(self, double key, int tail, int head) nogil
+    cdef void _pop(self) nogil
+    cdef int _tree(
+        self, int[:] districts, int[:] guide, bint guided, int root, int d_a,
+        int d_b, np.uint64_t *rng
+    ) nogil
+    cdef bint _split(
+        self, int[:] districts, int[:] guide, bint guided, DistrictStats stats,
+        int root, int d_a, int d_b, int pop_min, int pop_max, np.uint64_t *rng
+    ) nogil
+
+cdef bint recombine_row(
+    int[:] districts, int[:] guide, bint guided, DistrictStats stats,
+    TreeWorkspace workspace, int pop_min, int pop_max, int max_tries,
+    np.uint64_t *rng
+) nogil
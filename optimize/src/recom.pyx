@@ -0,0 +1,249 @@
+# cython: boundscheck=False
+# cython: wraparound=False
+# cython: initializedcheck=False
+# cython: nonecheck=False
+# cython: cdivision=True
+""" Spanning tree recombination of district plans.
+
+    Two adjacent districts are merged, a random spanning tree of the merged
+    region is drawn (the minimum spanning tree over random edge weights) and
+    one tree edge is cut so that both sides are within the population bounds.
+    Both sides of a tree cut are connected, so contiguity is kept.
+"""
+import os
+import numpy as np
+cimport numpy as np
+from cython.parallel cimport prange, threadid
+from cpython.ref cimport PyObject
+from libc.stdlib cimport malloc, free
+from src.district_stats cimport DistrictStats
+from src.utils.random_x cimport next_random, random_below
+
+# Tile marks.
+cdef enum:
+    OUTSIDE, TREE, CUT
+
+cdef class TreeWorkspace:
+    """ Scratch buffers for spanning tree splits on one state, reused between
+        calls so they do not allocate. Use one per thread.
+    """
+    def __init__(self, state):
+        cdef int n = state.n_tiles
+        cdef int nnz = state.neighbors_indices.shape[0]
+        self.indptr = state.neighbors_indptr
+        self.indices = state.neighbors_indices
+        self.tile_populations = state.tile_populations
+        self.mark = np.zeros(n, dtype='uint8')
+        self.order = np.empty(n, dtype='i')
+        self.parent = np.empty(n, dtype='i')
+        self.subtree_pop = np.empty(n, dtype='i8')
+        self.heap_keys = np.empty(max(1, nnz), dtype='d')
+        self.heap_tails = np.empty(max(1, nnz), dtype='i')
+        self.heap_heads = np.empty(max(1, nnz), dtype='i')
+        self.n_heap = 0
+
+    cdef void _push(self, double key, int tail, int head) nogil:
+        """ Push edge (tail, head) on the min heap. """
+        cdef int i = self.n_heap, up
+        self.n_heap += 1
+        while i > 0:
+            up = (i - 1) // 2
+            if self.heap_keys[up] <= key:
+                break
+            self.heap_keys[i] = self.heap_keys[up]
+            self.heap_tails[i] = self.heap_tails[up]
+            self.heap_heads[i] = self.heap_heads[up]
+            i = up
+        self.heap_keys[i] = key
+        self.heap_tails[i] = tail
+        self.heap_heads[i] = head
+
+    cdef void _pop(self) nogil:
+        """ Remove the top of the heap. """
+        cdef int i = 0, child
+        self.n_heap -= 1
+        cdef double key = self.heap_keys[self.n_heap]
+        cdef int tail = self.heap_tails[self.n_heap]
+        cdef int head = self.heap_heads[self.n_heap]
+        while True:
+            child = 2 * i + 1
+            if child >= self.n_heap:
+                break
+            if child + 1 < self.n_heap and self.heap_keys[child+1] < self.heap_keys[child]:
+                child += 1
+            if key <= self.heap_keys[child]:
+                break
+            self.heap_keys[i] = self.heap_keys[child]
+            self.heap_tails[i] = self.heap_tails[child]
+            self.heap_heads[i] = self.heap_heads[child]
+            i = child
+        self.heap_keys[i] = key
+        self.heap_tails[i] = tail
+        self.heap_heads[i] = head
+
+    cdef int _tree(
+        self, int[:] districts, int[:] guide, bint guided, int root, int d_a,
+        int d_b, np.uint64_t *rng
+    ) nogil:
+        """ Prim's algorithm from root over the tiles in d_a or d_b with random
+            edge weights. Edges between two districts of guide weigh more, so
+            the tree follows them when guided. Fills order and parent and
+            returns the number of tiles reached.
+        """
+        cdef int k, u, v, n_tree = 1
+        cdef double key
+        self.n_heap = 0
+        self.mark[root] = TREE
+        self.order[0] = root
+        self.parent[root] = -1
+        u = root
+        while True:
+            for k in range(self.indptr[u], self.indptr[u+1]):
+                v = self.indices[k]
+                if self.mark[v] != OUTSIDE or (districts[v] != d_a and districts[v] != d_b):
+                    continue
+                key = (next_random(rng) >> 11) * (1.0 / 9007199254740992.0)
+                if guided and guide[u] != guide[v]:
+                    key += 1
+                self._push(key, u, v)
+            # Next edge leaving the tree.
+            u = -1
+            while self.n_heap > 0:
+                v = self.heap_heads[0]
+                if self.mark[v] == OUTSIDE:
+                    u = v
+                    self.mark[u] = TREE
+                    self.parent[u] = self.heap_tails[0]
+                    self.order[n_tree] = u
+                    n_tree += 1
+                    self._pop()
+                    break
+                self._pop()
+            if u == -1:
+                return n_tree
+
+    cdef bint _split(
+        self, int[:] districts, int[:] guide, bint guided, DistrictStats stats,
+        int root, int d_a, int d_b, int pop_min, int pop_max, np.uint64_t *rng
+    ) nogil:
+        """ Draw one tree over d_a and d_b and cut it at a random balanced
+            edge, preferring edges between two districts of guide when guided.
+            Returns False, leaving the plan as it was, if no edge balances.
+        """
+        cdef int k, v, n_cut = 0, n_preferred = 0, cut = -1, cut_preferred = -1
+        cdef int n_sub = 0, n_sub_a = 0, d_sub, d_rest
+        cdef np.int64_t total = 0, pop
+        cdef int n_tree = self._tree(districts, guide, guided, root, d_a, d_b, rng)
+        cdef bint done = False
+        # A district that is not contiguous can not be re-split whole.
+        if n_tree == stats.tile_counts[d_a] + stats.tile_counts[d_b]:
+            for k in range(n_tree):
+                v = self.order[k]
+                self.subtree_pop[v] = self.tile_populations[v]
+            for k in range(n_tree - 1, 0, -1):
+                v = self.order[k]
+                self.subtree_pop[self.parent[v]] += self.subtree_pop[v]
+            total = self.subtree_pop[root]
+            for k in range(1, n_tree):
+                v = self.order[k]
+                pop = self.subtree_pop[v]
+                if pop < pop_min or pop > pop_max or total - pop < pop_min or total - pop > pop_max:
+                    continue
+                n_cut += 1
+                if random_below(rng, n_cut) == 0:
+                    cut = v
+                if guided and guide[v] != guide[self.parent[v]]:
+                    n_preferred += 1
+                    if random_below(rng, n_preferred) == 0:
+                        cut_preferred = v
+            if cut_preferred != -1:
+                cut = cut_preferred
+
+        if cut != -1:
+            # Parents come before children in order, so one pass marks the subtree.
+            self.mark[cut] = CUT
+            for k in range(1, n_tree):
+                v = self.order[k]
+                if self.mark[self.parent[v]] == CUT:
+                    self.mark[v] = CUT
+                if self.mark[v] == CUT:
+                    n_sub += 1
+                    n_sub_a += districts[v] == d_a
+            # Keep the labels that move the fewest tiles.
+            d_sub, d_rest = (d_a, d_b) if 2 * n_sub_a >= n_sub else (d_b, d_a)
+            for k in range(n_tree):
+                v = self.order[k]
+                stats._move(districts, v, d_sub if self.mark[v] == CUT else d_rest)
+            done = True
+
+        for k in range(n_tree):
+            self.mark[self.order[k]] = OUTSIDE
+        return done
+
+cdef bint recombine_row(
+    int[:] districts, int[:] guide, bint guided, DistrictStats stats,
+    TreeWorkspace workspace, int pop_min, int pop_max, int max_tries,
+    np.uint64_t *rng
+) nogil:
+    """ Merge a random pair of adjacent districts and re-split them, trying
+        up to max_tries trees. Returns if they were re-split.
+    """
+    cdef int k, ti, tj, d_b = -1, n_options = 0, _
+    if stats.n_frontier == 0:
+        return False
+    ti = stats.frontier_tiles[random_below(rng, stats.n_frontier)]
+    for k in range(workspace.indptr[ti], workspace.indptr[ti+1]):
+        tj = workspace.indices[k]
+        if districts[tj] != districts[ti]:
+            n_options += 1
+            if random_below(rng, n_options) == 0:
+                d_b = districts[tj]
+    for _ in range(max_tries):
+        if workspace._split(districts, guide, guided, stats, ti, districts[ti], d_b, pop_min, pop_max, rng):
+            return True
+    return False
+
+def recombine_batch(
+    int[:, :] districts, int[:, :] guides, state, int pop_min, int pop_max,
+    list stats, np.uint64_t[:] seeds, list workspaces=None, int max_tries=10,
+    n_threads=None
+):
+    """ Recombine every row of districts in parallel: row i has two adjacent
+        districts merged and re-split along a spanning tree that follows the
+        district borders of guides[i], or a uniformly random one when guides
+        is None (ReCom mutation). stats holds the DistrictStats of each
+        row, kept up to date. Row i draws from its own stream seeded by
+        seeds[i]. workspaces, one per thread, are made if not given. Returns
+        a mask of the rows that were re-split.
+    """
+    cdef int n = districts.shape[0]
+    cdef int n_thread = n_threads or os.cpu_count() or 1
+    cdef np.uint64_t[:] rngs = np.array(seeds, dtype='u8')
+    cdef np.uint8_t[:] changed = np.zeros(n, dtype='uint8')
+    cdef int i
+    cdef bint guided = guides is not None
+    if not guided:
+        guides = districts
+    assert guides.shape[0] == n and len(stats) == n
+    assert all(isinstance(s, DistrictStats) for s in stats)
+    if workspaces is None or len(workspaces) < n_thread:
+        workspaces = [ TreeWorkspace(state) for _ in range(n_thread) ]
+    assert all(isinstance(w, TreeWorkspace) for w in workspaces)
+    # Borrowed references, kept alive by the lists.
+    cdef PyObject **stats_ptrs = <PyObject **>malloc(n * sizeof(PyObject *))
+    cdef PyObject **workspace_ptrs = <PyObject **>malloc(n_thread * sizeof(PyObject *))
+    for i in range(n):
+        stats_ptrs[i] = <PyObject *>stats[i]
+    for i in range(n_thread):
+        workspace_ptrs[i] = <PyObject *>workspaces[i]
+    try:
+        for i in prange(n, nogil=True, schedule='dynamic', num_threads=n_thread):
+            changed[i] = recombine_row(
+                districts[i], guides[i], guided, <DistrictStats>stats_ptrs[i],
+                <TreeWorkspace>workspace_ptrs[threadid()], pop_min, pop_max,
+                max_tries, &rngs[i]
+            )
+    finally:
+        free(stats_ptrs)
+        free(workspace_ptrs)
+    return np.asarray(changed).astype(bool)
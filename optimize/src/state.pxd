@@ -5,4 +5,4 @@
 #     cdef public int[:,:] tile_voters
 #     cdef public float[:] tile_areas
 #     cdef public float[:, :] tile_centers, tile_bboxs
-#     cdef public list tile_vertices, tile_neighbors, tile_edges, tile_hulls, neighbor_graph, bbox
\ No newline at end of file
+#     cdef public list tile_vertices, tile_neighbors, tile_edges, tile_hulls, bbox
\ No newline at end of file
@@ -1,101 +1,224 @@
-import random, math, json
+import random, math, json, multiprocessing
 import numpy as np
 from collections import defaultdict, Counter
 from itertools import combinations
-from src.utils import polygon
+from src import statefile
+from src.utils.hull_x import tile_hulls
 from src.test import merge_polygons
 
-def flatten(a):
-    return [ item for sublist in a for item in sublist ]
-
 class State:
     """ The sate is static and knows nothing about districts.
         It is a set of connected tiles.
     """
     def __init__( self, tile_data ):
+        """ tile_data is either a JSON style dict (see bin/shp2statefile) or a
+            dict of packed arrays from statefile.pack / statefile.read. Packed
+            arrays are kept as is so memory mapped files are not copied.
+        """
+        if 'vertices' not in tile_data:
+            tile_data = statefile.pack(tile_data)
         self.n_tiles = len(tile_data['populations'])
-        self.tile_populations = np.array(tile_data['populations'], dtype='i')
-        self.tile_voters      = np.array(tile_data['voters'], dtype='i')
-        self.tile_vertices    = [ polygon.pround(p) for p in tile_data['shapes'] ]
-        self.tile_neighbors   = tile_data['neighbors']
-        self.tile_boundaries  = np.array(tile_data['boundaries'], dtype='i')
+        self.tile_populations = np.asarray(tile_data['populations'], dtype='i')
+        self.tile_voters      = np.asarray(tile_data['voters'], dtype='i')
+        self.tile_boundaries  = np.asarray(tile_data['boundaries'], dtype='i')
         self.population       = tile_data['population']
         self.bbox             = tile_data['bbox']
-        assert all(len(p) > 0 for p in self.tile_vertices)
-        assert all(len(n) > 0 for n in self.tile_neighbors)
+        # Flat geometry, see statefile.
+        self.vertices            = tile_data['vertices']
+        self.polygon_indptr      = tile_data['polygon_indptr']
+        self.tile_polygon_indptr = tile_data['tile_polygon_indptr']
+        # CSR adjacency, the neighbors of ti are indices[indptr[ti]:indptr[ti+1]].
+        self.neighbors_indptr  = np.asarray(tile_data['neighbors_indptr'], dtype='i')
+        self.neighbors_indices = np.asarray(tile_data['neighbors_indices'], dtype='i')
+        self._tile_neighbors = None
+        self._tile_vertices = None
+        self._tile_hulls = None
+        self._tile_hull_indptr = None
+        self._tile_hull_points = None
+        assert np.all(np.diff(self.tile_polygon_indptr) > 0)
+        assert np.all(np.diff(self.neighbors_indptr) > 0)
         self.calculateStats()
 
+    @property
+    def tile_neighbors(self):
+        """ Neighbor lists of each tile, built on first use. """
+        if self._tile_neighbors is None:
+            self._tile_neighbors = statefile.unpack_neighbors(
+                self.neighbors_indptr, self.neighbors_indices
+            )
+        return self._tile_neighbors
+
+    @property
+    def tile_vertices(self):
+        """ [tile][polygon][vertex] lists of integer tuples, built on first use. """
+        if self._tile_vertices is None:
+            self._tile_vertices = statefile.unpack_shapes(
+                self.vertices, self.polygon_indptr, self.tile_polygon_indptr
+            )
+        return self._tile_vertices
+
+    @property
+    def tile_hull_indptr(self):
+        """ Packed convex hull points of every tile, built on first use. The
+            hull of ti is tile_hull_points[tile_hull_indptr[ti]:tile_hull_indptr[ti+1]].
+        """
+        if self._tile_hull_indptr is None:
+            self._tile_hull_indptr, self._tile_hull_points = tile_hulls(
+                self.vertices, self.polygon_indptr, self.tile_polygon_indptr
+            )
+        return self._tile_hull_indptr
+
+    @property
+    def tile_hull_points(self):
+        self.tile_hull_indptr
+        return self._tile_hull_points
+
+    @property
+    def tile_hulls(self):
+        """ Convex hull points of each tile as lists, built on first use. """
+        if self._tile_hulls is None:
+            points = self.tile_hull_points.tolist()
+            indptr = self.tile_hull_indptr.tolist()
+            self._tile_hulls = [ points[a:b] for a, b in zip(indptr[:-1], indptr[1:]) ]
+        return self._tile_hulls
+
     def calculateStats(self):
         self._calculateStatsTileProperties()
         self._calculateStatsTileEdges()
-        self._calculateNeighborGraph()
         self.area = sum(self.tile_areas)
         assert type(self.population) == int
         assert (self.tile_voters.shape == (self.n_tiles, 2)), self.tile_voters.shape #Only support 2-parties for now.
         assert self.tile_populations.shape == (self.n_tiles,)
         assert self.tile_boundaries.shape  == (self.n_tiles,), self.tile_boundaries.shape
         assert self.tile_centers.shape     == (self.n_tiles, 2)
-        assert len(self.tile_vertices) == self.n_tiles
-        assert len(self.tile_neighbors) == self.n_tiles
+        assert self.tile_areas.shape       == (self.n_tiles,)
+        assert self.neighbors_indptr.shape == (self.n_tiles+1,)
 
     def _calculateStatsTileProperties(self):
-        self.tile_centers = np.array(
-            [ polygon.centroid(v) for v in self.tile_vertices ], dtype='f'
-        )
-        self.tile_areas = np.array(
-            [ polygon.area(v) for v in self.tile_vertices ], dtype='f'
-        )
-        self.tile_hulls = [ polygon.convex_hull(flatten(v)) for v in self.tile_vertices ]
+        vertices = np.asarray(self.vertices)
+        polygon_indptr = np.asarray(self.polygon_indptr)
+        n_polygons = polygon_indptr.shape[0] - 1
+        polygon_sizes = np.diff(polygon_indptr)
+        polygon_of_vertex = np.repeat(np.arange(n_polygons), polygon_sizes)
+        tile_of_polygon = np.repeat(np.arange(self.n_tiles), np.diff(self.tile_polygon_indptr))
+        # Each vertex starts a segment to the next vertex of its polygon.
+        self._segment_ends = np.arange(1, vertices.shape[0]+1)
+        last = polygon_indptr[1:][polygon_sizes > 0] - 1
+        self._segment_ends[last] = polygon_indptr[:-1][polygon_sizes > 0]
+        self._tile_of_vertex = tile_of_polygon[polygon_of_vertex]
+
+        # Centers are the middle of each tile's bounding box (polygon.centroid).
+        tile_starts = polygon_indptr[np.asarray(self.tile_polygon_indptr)[:-1]]
+        bb_min = np.minimum.reduceat(vertices, tile_starts, axis=0)
+        bb_max = np.maximum.reduceat(vertices, tile_starts, axis=0)
+        self.tile_centers = ((bb_min + bb_max) / 2).astype('f')
+
+        # Areas by the shoelace formula, summed over each tile's polygons.
+        ends = vertices[self._segment_ends]
+        shoelace = (ends[:, 0] - vertices[:, 0]) * (ends[:, 1] + vertices[:, 1])
+        polygon_areas = np.abs(np.bincount(polygon_of_vertex, shoelace, minlength=n_polygons)) / 2
+        self.tile_areas = np.bincount(
+            tile_of_polygon, polygon_areas, minlength=self.n_tiles
+        ).astype('f')
 
     def _calculateStatsTileEdges(self):
-        """ The districts come in as a
+        """ Build the flat edge table. Every polygon edge is hashed by its
+            sorted pair of vertex ids. An edge found in one polygon only is on
+            the state boundary, an edge found in two polygons is shared by
+            their tiles. Lengths are then summed per pair of tiles.
+
+            edge_tiles[e] = (tile_a, tile_b) with tile_a < tile_b, or
+            (tile_a, -1) for the state boundary. edge_lengths[e] is the length.
+        """
+        vertices = np.asarray(self.vertices)
+
+        # Give equal (integer) coordinates equal vertex ids.
+        xy = vertices.astype('i8')
+        xy -= xy.min(axis=0)
+        _, vertex_ids = np.unique(xy[:, 0] * (xy[:, 1].max() + 1) + xy[:, 1], return_inverse=True)
+
+        # Segments from _calculateStatsTileProperties, skip closing vertices.
+        seg_start = np.flatnonzero(vertex_ids != vertex_ids[self._segment_ends])
+        seg_end = self._segment_ends[seg_start]
+        seg_tile = self._tile_of_vertex[seg_start]
+        seg_length = np.hypot(*(vertices[seg_start] - vertices[seg_end]).T)
+        a, b = vertex_ids[seg_start], vertex_ids[seg_end]
+        keys = np.minimum(a, b).astype('i8') * (vertex_ids.max() + 1) + np.maximum(a, b)
+
+        # Group equal segments.
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        group_start = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        group_size = np.diff(np.r_[group_start, len(keys)])
+
+        # Boundary segments.
+        seg = order[group_start[group_size == 1]]
+        pairs_a, pairs_b, pairs_seg = [ seg_tile[seg] ], [ np.full(len(seg), -1) ], [ seg ]
+        # Segments shared by two polygons, dropped if both are of the same tile.
+        first = group_start[group_size == 2]
+        ta, tb = seg_tile[order[first]], seg_tile[order[first+1]]
+        shared = ta != tb
+        pairs_a.append(np.minimum(ta, tb)[shared])
+        pairs_b.append(np.maximum(ta, tb)[shared])
+        pairs_seg.append(order[first][shared])
+        # Rare, overlapping polygons where more than two share a segment.
+        for gi in np.flatnonzero(group_size > 2):
+            segs = order[group_start[gi]: group_start[gi]+group_size[gi]]
+            for ti, tj in combinations(sorted(set(seg_tile[segs].tolist())), 2):
+                pairs_a.append([ ti ])
+                pairs_b.append([ tj ])
+                pairs_seg.append(segs[:1])
+
+        pairs_a = np.concatenate(pairs_a).astype('i8')
+        pairs_b = np.concatenate(pairs_b).astype('i8')
+        pairs_seg = np.concatenate(pairs_seg).astype('i8')
+        pair_keys, segment_edges = np.unique(
+            pairs_a * (self.n_tiles + 1) + (pairs_b + 1), return_inverse=True
+        )
+        self.edge_tiles = np.stack([
+            pair_keys // (self.n_tiles + 1), pair_keys % (self.n_tiles + 1) - 1
+        ], axis=1).astype('i')
+        self.edge_lengths = np.bincount(
+            segment_edges, weights=seg_length[pairs_seg], minlength=len(pair_keys)
+        ).astype('f')
+        # Edges of each tile in CSR form, for incremental district stats.
+        inner = np.flatnonzero(self.edge_tiles[:, 1] >= 0)
+        edge_ends = np.r_[self.edge_tiles[:, 0], self.edge_tiles[inner, 1]]
+        edge_ids = np.r_[np.arange(len(self.edge_tiles)), inner]
+        self.tile_edge_indices = edge_ids[np.argsort(edge_ends, kind='stable')].astype('i')
+        self.tile_edge_indptr = np.zeros(self.n_tiles+1, dtype='i')
+        np.cumsum(np.bincount(edge_ends, minlength=self.n_tiles), out=self.tile_edge_indptr[1:])
+        # Vertex indexes of each segment and the edge it belongs to, only
+        # used to build tile_edges.
+        self._edge_segments = np.stack([ seg_start[pairs_seg], seg_end[pairs_seg] ], axis=1)
+        self._segment_edges = segment_edges
+        self._tile_edges = None
+
+    @property
+    def tile_edges(self):
+        """ [ { tj or 'boundry' => { 'length', 'edges' } } ] for each tile.
+            Built from the edge table on first use, used for drawing and JSON.
         """
-        self.tile_edges = [ #[ {tj => [length, edge_list] } } ]
-            defaultdict(lambda: { 'length': 0, 'edges':[  ] })
-            for _ in range(self.n_tiles)
-        ]
-
-        v2ti = defaultdict(set) # Vert to its tile indexes.
-        v2poly = defaultdict(set)
-        for ti, polygons in enumerate(self.tile_vertices):
-            for pi, poly in enumerate(polygons):
-                for vert in poly:
-                    v2ti[vert].add(ti)
-                    v2poly[vert].add(f'{ti}:{pi}') # Polygon id is string.
-
-        for ti, polygons in enumerate(self.tile_vertices):
-            for poly in polygons:
-                for vi, vert_a in enumerate(poly):
-                    vert_b = poly[(vi+1) % len(poly)]
-                    edge = (vert_a, vert_b)
-                    length = math.hypot(vert_a[0] - vert_b[0], vert_a[1] - vert_b[1])
-                    edge_tiles = v2ti[vert_a].intersection(v2ti[vert_b])
-                    edge_polys = v2poly[vert_a].intersection(v2poly[vert_b])
-                    if len(edge_polys) == 1: # Is boundary edge if borders one polygon.
-                        self.tile_edges[ ti ][ 'boundry' ][ 'length' ] += length
-                        self.tile_edges[ ti ][ 'boundry' ][ 'edges' ].append(( vert_a, vert_b ))
-                    else:
-                        for ti_other in edge_tiles:
-                            if ti_other != ti:
-                                self.tile_edges[ ti ][ ti_other ][ 'length' ] += length
-                                self.tile_edges[ ti ][ ti_other ][ 'edges' ].append(( vert_a, vert_b ))
-
-        # Convert to regular dicts so that it can be JSON'd.
-        self.tile_edges = [ dict(x) for x in self.tile_edges ]
-
-    def _calculateNeighborGraph(self):
-        self.neighbor_graph = []
-        for i in range(self.n_tiles):
-            ng = dict()
-            neighors = self.tile_neighbors[i]
-            for j in neighors:
-                ng[j] = [k for k in self.tile_neighbors[j] if k in neighors]
-            self.neighbor_graph.append(ng)
-
-    def _tileDist(self, i, j):
-        x1, y1 = self.tile_centers[i]
-        x2, y2 = self.tile_centers[j]
-        return math.hypot(x1-x2, y1-y2)
+        if self._tile_edges is None:
+            points = [ tuple(p) for p in np.asarray(self.vertices).astype('i8').tolist() ]
+            edge_tiles = self.edge_tiles.tolist()
+            tile_edges = [ {} for _ in range(self.n_tiles) ]
+            for (ta, tb), length in zip(edge_tiles, self.edge_lengths.tolist()):
+                if tb == -1:
+                    tile_edges[ta]['boundry'] = { 'length': length, 'edges': [] }
+                else:
+                    tile_edges[ta][tb] = { 'length': length, 'edges': [] }
+                    tile_edges[tb][ta] = { 'length': length, 'edges': [] }
+            for (si, sj), ei in zip(self._edge_segments.tolist(), self._segment_edges.tolist()):
+                ta, tb = edge_tiles[ei]
+                edge = (points[si], points[sj])
+                if tb == -1:
+                    tile_edges[ta]['boundry']['edges'].append(edge)
+                else:
+                    tile_edges[ta][tb]['edges'].append(edge)
+                    tile_edges[tb][ta]['edges'].append(edge)
+            self._tile_edges = tile_edges
+        return self._tile_edges
 
     def contract(self, seed=None):
         """ Do Star contraction to contract the graph.
@@ -108,103 +231,95 @@ class State:
         stars = np.random.randint(0, 2, size=self.n_tiles, dtype='uint8')
         # Store the idx of tile this one will join into.
         to_join = np.arange(self.n_tiles, dtype='int32')
-        # Turn into sets for fast intersection tests.
-        verts = [ set(flatten(polygons)) for polygons in self.tile_vertices ]
-        # For each non-star tile pick a star neighbor to join onto.
-        for ti in range(self.n_tiles):
-            if not stars[ti]:
-                options = [ j for j in self.tile_neighbors[ti] if stars[j] and len(verts[ti] & verts[j]) > 1 ]
-                options = [ (self._tileDist(ti, j), j) for j in options ]
-                options.sort()
-                if len(options):
-                    # to_join[ti] = random.choice(options)[1]
-                    to_join[ti] = options[0][1]
+        # For each non-star tile pick the closest star neighbor that it shares
+        # a boundary with. Shared boundaries come from the edge table.
+        shared = self.edge_tiles[ self.edge_tiles[:, 1] != -1 ].astype('i8')
+        ti, tj = np.concatenate([ shared, shared[:, ::-1] ]).T
+        is_neighbor = np.isin(ti * self.n_tiles + tj, self._neighborKeys())
+        options = is_neighbor & (stars[ti] == 0) & (stars[tj] == 1)
+        ti, tj = ti[options], tj[options]
+        dist = np.hypot(*(self.tile_centers[ti] - self.tile_centers[tj]).astype('f8').T)
+        order = np.lexsort((tj, dist, ti))
+        ti, tj = ti[order], tj[order]
+        first = np.r_[True, ti[1:] != ti[:-1]]
+        to_join[ti[first]] = tj[first]
 
         # Prevent created islands. If an interior tiles neighbors are all
         # combining, join into that one as well.
-        for ti in range(self.n_tiles):
-            ji = to_join[ti]
-            jn = to_join[self.tile_neighbors[ti][0]]
-            if self.tile_boundaries[ti]:
-                continue
-            if ji != jn and all(to_join[tn] == jn for tn in self.tile_neighbors[ti]):
-                to_join[ti] = jn
+        indptr = self.neighbors_indptr
+        neighbor_joins = to_join[self.neighbors_indices]
+        jmin = np.minimum.reduceat(neighbor_joins, indptr[:-1])
+        jmax = np.maximum.reduceat(neighbor_joins, indptr[:-1])
+        surrounded = (jmin == jmax) & (jmin != to_join) & (self.tile_boundaries == 0)
+        to_join[surrounded] = jmin[surrounded]
         # Mapping go between indexes of old state to new state.
         state, mapping1 = self._mergeTiles(to_join)
         return state, mapping1
-        # state, mapping2 = state.mergeIslands()
-        # We now how to merge the mappings!
-        # final_mapping = np.array([ mapping2[mapping1[ti]] for ti in range(self.n_tiles) ], dtype='i')
-        # return state, final_mapping
+
+    def _neighborKeys(self):
+        """ ti * n_tiles + tj for every pair of neighbors. """
+        rows = np.repeat(np.arange(self.n_tiles, dtype='i8'), np.diff(self.neighbors_indptr))
+        return rows * self.n_tiles + self.neighbors_indices
 
     def mergeIslands(self):
         # Check for tiles totally surrounded by others.
         to_join = np.arange(self.n_tiles, dtype='int32')
-        for ti in range(self.n_tiles):
-            if len(self.tile_neighbors[ti]) == 1:
-                to_join[ti] = self.tile_neighbors[ti][0]
+        degrees = np.diff(self.neighbors_indptr)
+        islands = np.flatnonzero(degrees == 1)
+        to_join[islands] = self.neighbors_indices[self.neighbors_indptr[islands]]
         state, mapping = self._mergeTiles(to_join)
-        assert all(len(n) > 1 for n in state.tile_neighbors)
+        assert np.all(np.diff(state.neighbors_indptr) > 1)
         return state, mapping
 
     def _mergeTiles(self, to_join):
         # Starred tiles will become the new tiles and others will merge into them.
-        old_2_new_idxs = defaultdict(lambda: len(old_2_new_idxs))
-        mapping = to_join.copy()
-        for i, idx in enumerate(to_join):
-            mapping[i] = old_2_new_idxs[idx]
-
-        new_n_tiles = len(set(mapping))
-
-        # Create the data structures for new state.
-        tile_voters      = np.zeros((new_n_tiles, 2), dtype='i')
-        tile_populations = np.zeros(new_n_tiles, dtype='i')
-        tile_boundaries  = np.zeros(new_n_tiles, dtype='i')
-        polygon_groups   = [ [] for _ in range(new_n_tiles) ]
-        tile_neighbors   = [ set() for _ in range(new_n_tiles) ]
-
-        # Merge old states into new states.
-        for i_from, i_to in enumerate(mapping):
-            tile_populations[i_to] += self.tile_populations[i_from]
-            tile_voters[i_to] += self.tile_voters[i_from]
-            if (self.tile_boundaries[i_from]):
-                tile_boundaries[i_to] = True
-            polygon_groups[i_to].append(self.tile_vertices[ i_from ])
-            for j in self.tile_neighbors[ i_from ]:
-                if mapping[ j ] != i_to:
-                    tile_neighbors[ i_to ].add(int(mapping[j])) # cast to int to make it jsonable
-
-        # Create new polygon objects out of polygon groups.
-        tile_vertices = [  ]
-        for idx, pg in enumerate(polygon_groups):
-            # polygon = merge_polygons(pg)
-            polygon = flatten(pg)
-            # if len(polygon) < 3:
-            #     print(polygon)
-            #     print([len(p) for p in pg ])
-            #     print( np.argwhere(mapping == idx) )
-            #     for a, b in combinations(pg,2):
-            #         print(len(set(a)&set(b)))
-            # assert len(polygon) > 2
-            tile_vertices.append(polygon)
-
-        # verts = [ set(v) for v in tile_vertices ]
-        # for (i, a), (j, b) in combinations(enumerate(verts), 2):
-        #     if len(a) == len(b) and a & b == a:
-        #         print('DUPLICATE TILES FOUND', i, j)
-        #         print(np.argwhere(mapping == i).T[0])
-        #         print(np.argwhere(mapping == j).T[0])
-        #         # exit()
-
-        tile_neighbors = [ list(tn) for tn in tile_neighbors ]
+        # New indexes are given in order of first appearance in to_join.
+        _, first, inverse = np.unique(to_join, return_index=True, return_inverse=True)
+        new_index = np.empty(len(first), dtype='int32')
+        new_index[np.argsort(first)] = np.arange(len(first), dtype='int32')
+        mapping = new_index[inverse]
+        new_n_tiles = len(first)
+
+        # Sum populations and voters into the new tiles.
+        tile_populations = np.bincount(mapping, self.tile_populations, new_n_tiles).astype('i')
+        tile_voters = np.stack([
+            np.bincount(mapping, self.tile_voters[:, 0], new_n_tiles),
+            np.bincount(mapping, self.tile_voters[:, 1], new_n_tiles)
+        ], axis=1).astype('i')
+        tile_boundaries = (np.bincount(mapping, self.tile_boundaries, new_n_tiles) > 0).astype('i')
+
+        # The polygons of a new tile are those of its old tiles, in order.
+        polygon_indptr = np.asarray(self.polygon_indptr)
+        tile_polygon_sizes = np.diff(self.tile_polygon_indptr)
+        polygon_mapping = np.repeat(mapping, tile_polygon_sizes)
+        polygon_order = np.argsort(polygon_mapping, kind='stable')
+        polygon_sizes = np.diff(polygon_indptr)[polygon_order]
+        new_polygon_indptr = np.zeros(len(polygon_sizes)+1, dtype='i8')
+        np.cumsum(polygon_sizes, out=new_polygon_indptr[1:])
+        vertex_order = np.arange(new_polygon_indptr[-1]) + np.repeat(
+            polygon_indptr[polygon_order] - new_polygon_indptr[:-1], polygon_sizes
+        )
+        new_tile_polygon_indptr = np.zeros(new_n_tiles+1, dtype='i8')
+        np.cumsum(np.bincount(mapping, tile_polygon_sizes, new_n_tiles), out=new_tile_polygon_indptr[1:])
+
+        # Remap adjacency, dropping self loops and duplicates.
+        keys = self._neighborKeys()
+        rows, cols = mapping[keys // self.n_tiles], mapping[keys % self.n_tiles]
+        keys = np.unique(rows[rows != cols].astype('i8') * new_n_tiles + cols[rows != cols])
+        neighbors_indptr = np.zeros(new_n_tiles+1, dtype='i')
+        np.cumsum(np.bincount(keys // new_n_tiles, minlength=new_n_tiles), out=neighbors_indptr[1:])
+
         state = State({
             'bbox': self.bbox,
+            'population': self.population,
+            'populations': tile_populations,
             'voters': tile_voters,
-            'shapes':    tile_vertices,
-            'boundaries':  tile_boundaries,
-            'neighbors' :  tile_neighbors,
-            'population':  self.population,
-            'populations': tile_populations
+            'boundaries': tile_boundaries,
+            'vertices': np.asarray(self.vertices)[vertex_order],
+            'polygon_indptr': new_polygon_indptr,
+            'tile_polygon_indptr': new_tile_polygon_indptr,
+            'neighbors_indptr': neighbors_indptr,
+            'neighbors_indices': (keys % new_n_tiles).astype('i'),
         })
         return state, mapping
 
@@ -217,6 +332,7 @@ class State:
         smooth_steps=6
     ):
         from src.utils.voronoi import smoothedRandomVoronoi
+        from src.utils.tiling import smooth
         if seed is not None:
             random.seed(seed)
             np.random.seed(seed)
@@ -235,13 +351,8 @@ class State:
             tile_voters[ti, 0] = n_tiles * city_strength / n_cities
 
         # Smooth.
-        for _ in range(smooth_steps):
-            _tile_voters = np.zeros_like(tile_voters)
-            for ti in range(n_tiles):
-                nn = len(tile_neighbors[ti])
-                _tile_voters[ti, 0] = sum(tile_voters[ti_o, 0] for ti_o in tile_neighbors[ti]) / nn
-                _tile_voters[ti, 1] = sum(tile_voters[ti_o, 1] for ti_o in tile_neighbors[ti]) / nn
-            tile_voters = 0.5 * (_tile_voters + tile_voters)
+        indptr, indices = statefile.pack_neighbors(tile_neighbors)
+        tile_voters = smooth(tile_voters, indptr, indices, smooth_steps)
         
         # Ensure same number of each party.
         tile_voters[:, 0] *= 1 / tile_voters[:, 0].sum()
@@ -273,11 +384,64 @@ class State:
         return state
 
     @classmethod
-    def fromFile(cls, filePath):
+    def fromFile(cls, filePath, mmap=True):
+        """ Load a binary state file (see statefile) or a JSON state file. """
+        if statefile.is_statefile(filePath):
+            return State(statefile.read(filePath, mmap=mmap))
         with open(filePath, 'r') as file:
             state_data = json.load(file)
         return State(state_data)
 
+    def toFile(self, filePath):
+        """ Write the state as a binary state file. """
+        statefile.write(filePath, {
+            'n_tiles': self.n_tiles,
+            'population': self.population,
+            'bbox': self.bbox,
+            'vertices': self.vertices,
+            'polygon_indptr': self.polygon_indptr,
+            'tile_polygon_indptr': self.tile_polygon_indptr,
+            'neighbors_indptr': self.neighbors_indptr,
+            'neighbors_indices': self.neighbors_indices,
+            'populations': self.tile_populations,
+            'voters': self.tile_voters,
+            'boundaries': self.tile_boundaries
+        })
+
+    def toShared(self):
+        """ Copy the numpy arrays of the state into shared memory. Returns
+            (arrays, attributes) to pass to worker processes, where fromShared
+            rebuilds the state on the same memory. attributes only holds
+            scalars and the bbox, so it is cheap to pickle. Lazy arrays are
+            only shared if already computed, lazy lists are rebuilt on first
+            use in the worker.
+        """
+        arrays, attributes = {}, {}
+        for name, value in vars(self).items():
+            if isinstance(value, np.ndarray) and value.dtype != object:
+                raw = multiprocessing.RawArray('b', max(1, value.nbytes))
+                np.frombuffer(raw, dtype=value.dtype, count=value.size)[:] = value.ravel()
+                arrays[name] = (raw, value.dtype.str, value.shape)
+            elif name.startswith('_tile_'):
+                attributes[name] = None
+            elif name == 'bbox':
+                attributes[name] = [ float(v) for v in value ]
+            else:
+                assert value is None or isinstance(value, (int, float, str, np.generic)), \
+                    'Can not share state attribute %s' % name
+                attributes[name] = value
+        return arrays, attributes
+
+    @classmethod
+    def fromShared(cls, arrays, attributes):
+        """ Rebuild a state from the output of toShared. """
+        state = cls.__new__(cls)
+        state.__dict__.update(attributes)
+        for name, (raw, dtype, shape) in arrays.items():
+            size = int(np.prod(shape))
+            setattr(state, name, np.frombuffer(raw, dtype=dtype, count=size).reshape(shape))
+        return state
+
     def toJSON(self):
         return {
             'n_tiles': self.n_tiles,
@@ -0,0 +1,159 @@
+""" Packed binary state files.
+
+    A state file is a short JSON header followed by raw arrays, each aligned to
+    64 bytes so they can be opened with np.memmap. Geometry is stored flat:
+    every polygon vertex in one (n_vertices, 2) array, with offset arrays giving
+    where each polygon starts in it and where each tile's polygons start.
+    Adjacency is stored in CSR form. Opening a file maps the arrays
+    copy-on-write, so many processes reading the same state share one copy in
+    the page cache (and Cython can still take writable memoryviews of them).
+
+    Layout:
+        8 bytes     MAGIC
+        8 bytes     header length (little-endian uint64)
+        n bytes     JSON header: version, n_tiles, population, bbox and the
+                    dtype, shape and offset of every array.
+        ...         array data, offsets are relative to the first aligned byte
+                    after the header.
+"""
+import json
+import numpy as np
+
+MAGIC = b'ANTMSTAT'
+VERSION = 1
+ALIGN = 64
+
+# name -> dtype of every array in a state file.
+ARRAYS = {
+    'vertices': '<f8',             # (n_vertices, 2) polygon coordinates.
+    'polygon_indptr': '<i8',       # (n_polygons+1,) offsets into vertices.
+    'tile_polygon_indptr': '<i8',  # (n_tiles+1,) offsets into polygon_indptr.
+    'neighbors_indptr': '<i4',     # (n_tiles+1,) offsets into neighbors_indices.
+    'neighbors_indices': '<i4',    # (n_edges,) neighbor tile indexes.
+    'populations': '<i4',          # (n_tiles,)
+    'voters': '<i4',               # (n_tiles, 2)
+    'boundaries': '<i4',           # (n_tiles,)
+}
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+def pack_shapes(shapes):
+    """ Convert nested [tile][polygon][vertex] shapes to flat arrays.
+        Coordinates are rounded to integers, matching polygon.pround.
+    """
+    polygon_sizes = [ len(poly) for polygons in shapes for poly in polygons ]
+    tile_sizes = [ len(polygons) for polygons in shapes ]
+    vertices = np.array(
+        [ vert for polygons in shapes for poly in polygons for vert in poly ],
+        dtype='f8'
+    ).reshape(-1, 2)
+    polygon_indptr = np.zeros(len(polygon_sizes)+1, dtype='i8')
+    np.cumsum(polygon_sizes, out=polygon_indptr[1:])
+    tile_polygon_indptr = np.zeros(len(tile_sizes)+1, dtype='i8')
+    np.cumsum(tile_sizes, out=tile_polygon_indptr[1:])
+    return np.round(vertices), polygon_indptr, tile_polygon_indptr
+
+def unpack_shapes(vertices, polygon_indptr, tile_polygon_indptr):
+    """ Inverse of pack_shapes, returns lists of integer vertex tuples. """
+    points = [ tuple(p) for p in np.asarray(vertices).astype('i8').tolist() ]
+    pi = np.asarray(polygon_indptr).tolist()
+    ti = np.asarray(tile_polygon_indptr).tolist()
+    polygons = [ points[pi[i]:pi[i+1]] for i in range(len(pi)-1) ]
+    return [ polygons[ti[i]:ti[i+1]] for i in range(len(ti)-1) ]
+
+def pack_neighbors(neighbors):
+    """ Convert a list of neighbor lists to CSR (indptr, indices) arrays. """
+    indptr = np.zeros(len(neighbors)+1, dtype='i4')
+    np.cumsum([ len(n) for n in neighbors ], out=indptr[1:])
+    indices = np.fromiter(
+        (j for n in neighbors for j in n), dtype='i4', count=int(indptr[-1])
+    )
+    return indptr, indices
+
+def unpack_neighbors(indptr, indices):
+    indptr = np.asarray(indptr).tolist()
+    indices = np.asarray(indices).tolist()
+    return [ indices[indptr[i]:indptr[i+1]] for i in range(len(indptr)-1) ]
+
+def pack(tile_data):
+    """ Convert a JSON style tile_data dict to a dict of packed arrays. """
+    vertices, polygon_indptr, tile_polygon_indptr = pack_shapes(tile_data['shapes'])
+    neighbors_indptr, neighbors_indices = pack_neighbors(tile_data['neighbors'])
+    return {
+        'n_tiles': len(tile_data['populations']),
+        'population': int(tile_data['population']),
+        'bbox': [ float(v) for v in tile_data['bbox'] ],
+        'vertices': vertices,
+        'polygon_indptr': polygon_indptr,
+        'tile_polygon_indptr': tile_polygon_indptr,
+        'neighbors_indptr': neighbors_indptr,
+        'neighbors_indices': neighbors_indices,
+        'populations': np.asarray(tile_data['populations']),
+        'voters': np.asarray(tile_data['voters']),
+        'boundaries': np.asarray(tile_data['boundaries']),
+    }
+
+def is_statefile(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def write(path, packed):
+    """ Write a dict of packed arrays (see pack) to path. """
+    arrays = {
+        name: np.ascontiguousarray(packed[name], dtype=dtype)
+        for name, dtype in ARRAYS.items()
+    }
+    header = {
+        'version': VERSION,
+        'n_tiles': int(packed['n_tiles']),
+        'population': int(packed['population']),
+        'bbox': list(packed['bbox']),
+        'arrays': {}
+    }
+    offset = 0
+    for name, arr in arrays.items():
+        header['arrays'][name] = {
+            'dtype': ARRAYS[name], 'shape': list(arr.shape), 'offset': offset
+        }
+        offset = _align(offset + arr.nbytes)
+
+    header_bytes = json.dumps(header).encode('utf8')
+    data_start = _align(len(MAGIC) + 8 + len(header_bytes))
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(header_bytes)).tobytes())
+        f.write(header_bytes)
+        for name, arr in arrays.items():
+            f.seek(data_start + header['arrays'][name]['offset'])
+            f.write(arr.tobytes())
+        f.truncate(data_start + offset)
+
+def read(path, mmap=True):
+    """ Read a state file. Arrays are copy-on-write memory maps unless mmap=False. """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a state file.')
+        header_len = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+        header = json.loads(f.read(header_len).decode('utf8'))
+    if header['version'] != VERSION:
+        raise ValueError(f'Unsupported state file version: {header["version"]}')
+    data_start = _align(len(MAGIC) + 8 + header_len)
+    packed = {
+        'n_tiles': header['n_tiles'],
+        'population': header['population'],
+        'bbox': header['bbox'],
+    }
+    for name, info in header['arrays'].items():
+        shape = tuple(info['shape'])
+        if mmap and np.prod(shape) > 0:
+            packed[name] = np.memmap(
+                path, dtype=info['dtype'], mode='c',
+                offset=data_start + info['offset'], shape=shape
+            )
+        else:
+            with open(path, 'rb') as f:
+                f.seek(data_start + info['offset'])
+                count = int(np.prod(shape))
+                packed[name] = np.fromfile(f, dtype=info['dtype'], count=count).reshape(shape)
+    return packed
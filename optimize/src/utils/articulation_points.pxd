@@ -0,0 +1,16 @@
+cimport numpy as np
+
+cdef class Workspace:
+    cdef int[:] indptr, indices
+    # Discovery time (-1 if unvisited), low link, DFS parent, next CSR
+    # position and DFS stack per tile.
+    cdef int[:] disc, low, parent, next_edge, stack
+    # Tiles visited since the last reset, to clear them.
+    cdef int[:] visited
+    cdef np.uint8_t[:] ap
+    cdef int n_visited, time
+
+    cdef void _search(self, int[:] partition, int root) nogil
+    cdef void _visit(self, int u, int parent) nogil
+    cdef void _reset(self) nogil
+    cdef int _removable(self, int[:] partition, int[:] candidates, int[:] out) nogil
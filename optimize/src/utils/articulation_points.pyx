@@ -3,105 +3,150 @@
 # cython: initializedcheck=False
 # cython: nonecheck=False
 # cython: cdivision=True
-
+""" Articulation points of the districts of a partition, found with an
+    iterative Tarjan DFS over the CSR adjacency of the state.
+"""
 cimport numpy as np
 import numpy as np
-
-cdef APUtil(
-    int *time,
-    int[:] tile_districts,
-    map,
-    int u,
-    int[:] visited,
-    int[:] ap,
-    int[:] parent,
-    double[:] low,
-    double[:] disc
+from src.districts cimport is_frontier
+from src.district_stats cimport DistrictStats
+
+cdef class Workspace:
+    """ Scratch buffers for articulation point searches on one state, reused
+        between calls so they do not allocate. Use one per thread.
+    """
+    def __init__(self, state):
+        cdef int n = state.n_tiles
+        self.indptr = state.neighbors_indptr
+        self.indices = state.neighbors_indices
+        self.disc = np.full(n, -1, dtype='i')
+        self.low = np.empty(n, dtype='i')
+        self.parent = np.empty(n, dtype='i')
+        self.next_edge = np.empty(n, dtype='i')
+        self.stack = np.empty(n, dtype='i')
+        self.visited = np.empty(n, dtype='i')
+        self.ap = np.zeros(n, dtype='uint8')
+        self.n_visited = 0
+        self.time = 0
+
+    cdef void _search(self, int[:] partition, int root) nogil:
+        """ DFS over the district of root, marking its articulation points in
+            ap and appending its tiles to visited.
+        """
+        cdef int u, v, p, top = 0, root_children = 0
+        cdef int d = partition[root]
+        self._visit(root, -1)
+        self.stack[0] = root
+        while top >= 0:
+            u = self.stack[top]
+            if self.next_edge[u] < self.indptr[u+1]:
+                v = self.indices[self.next_edge[u]]
+                self.next_edge[u] += 1
+                # Dont count connections between tiles of different districts.
+                if partition[v] != d:
+                    continue
+                if self.disc[v] == -1:
+                    self._visit(v, u)
+                    top += 1
+                    self.stack[top] = v
+                    if u == root:
+                        root_children += 1
+                elif v != self.parent[u] and self.disc[v] < self.low[u]:
+                    self.low[u] = self.disc[v]
+            else:
+                # Done with u, pass its low value up to its parent.
+                top -= 1
+                if top >= 0:
+                    p = self.stack[top]
+                    if self.low[u] < self.low[p]:
+                        self.low[p] = self.low[u]
+                    if p != root and self.low[u] >= self.disc[p]:
+                        self.ap[p] = True
+        # The root is one if it has two or more children.
+        if root_children > 1:
+            self.ap[root] = True
+
+    cdef inline void _visit(self, int u, int parent) nogil:
+        self.disc[u] = self.time
+        self.low[u] = self.time
+        self.time += 1
+        self.parent[u] = parent
+        self.next_edge[u] = self.indptr[u]
+        self.visited[self.n_visited] = u
+        self.n_visited += 1
+
+    cdef void _reset(self) nogil:
+        """ Clear the marks of the visited tiles. """
+        cdef int k
+        for k in range(self.n_visited):
+            self.disc[self.visited[k]] = -1
+            self.ap[self.visited[k]] = False
+        self.n_visited = 0
+        self.time = 0
+
+    cdef int _removable(self, int[:] partition, int[:] candidates, int[:] out) nogil:
+        """ Write to out the candidates that can leave their district without
+            disconnecting or emptying it, with one DFS per district that has
+            a candidate. Returns their number.
+        """
+        cdef int i, k, ti, n_out = 0
+        cdef bint alone
+        for i in range(candidates.shape[0]):
+            if self.disc[candidates[i]] == -1:
+                self._search(partition, candidates[i])
+        for i in range(candidates.shape[0]):
+            ti = candidates[i]
+            if self.ap[ti]:
+                continue
+            alone = True
+            for k in range(self.indptr[ti], self.indptr[ti+1]):
+                if partition[self.indices[k]] == partition[ti]:
+                    alone = False
+                    break
+            if not alone:
+                out[n_out] = ti
+                n_out += 1
+        self._reset()
+        return n_out
+
+cpdef int[:] removable_tiles(
+    state, int[:] partition, DistrictStats stats=None, Workspace workspace=None
 ):
-    cdef int v
-    # Count of children in current node
-    cdef int children = 0
-
-    # Mark the current node as visited and print it
-    visited[ u ] = True
-
-    # Initialize discovery time and low value
-    disc[u] = time[0]
-    low[u] = time[0]
-    time[0] += 1
-
-    cdef list neighbors = map.tile_neighbors[u]
-    for v in neighbors:
-        # Dont count connections between tiles of differnet districts.
-        if (tile_districts[u] != tile_districts[v]):
-            continue
-        # If v is not visited yet, then make it a child of u
-        # in DFS tree and recur for it
-        if visited[v] == False:
-            parent[v] = u
-            children += 1
-            APUtil(time, tile_districts, map, v, visited, ap, parent, low, disc)
-
-            # Check if the subtree rooted with v has a connection to
-            # one of the ancestors of u
-            low[u] = min(low[u], low[v])
-
-            # u is an articulation point in following cases
-            # (1) u is root of DFS tree and has two or more chilren.
-            if parent[u] == -1 and children > 1:
-                ap[u] = True
-
-            #(2) If u is not root and low value of one of its child is more
-            # than discovery value of u.
-            if parent[u] != -1 and low[v] >= disc[u]:
-                ap[u] = True
-
-        # Update low value of u for parent function calls
-        elif v != parent[u]:
-            low[u] = min(low[u], disc[v])
-
-cpdef int[:] articulationPoints(int[:] tile_districts, map) except *:
-    cdef int time = 0
-    cdef int n, t
-    n = map.n_tiles
-    cdef int[:] visited = np.zeros(n, dtype='i')
-    cdef int[:] parent = np.full(n, -1.0, dtype='i')
-    cdef int[:] ap = np.zeros(n, dtype='i')
-    cdef double[:] low = np.full(n, np.inf)
-    cdef double[:] disc = np.full(n, np.inf)
-
-    for t in range(n):
-        if not visited[t]:
-            APUtil(&time, tile_districts, map, t, visited, ap, parent, low, disc)
-
+    """ The frontier tiles that can move to another district without
+        disconnecting or emptying their own. The frontier comes from stats
+        when given.
+    """
+    cdef int[:] indptr = state.neighbors_indptr
+    cdef int[:] indices = state.neighbors_indices
+    cdef int[:] candidates
+    cdef int[:] out = np.empty(state.n_tiles, dtype='i')
+    cdef int ti, n = 0
+    if workspace is None:
+        workspace = Workspace(state)
+    if stats is not None:
+        candidates = stats.frontier_tiles[:stats.n_frontier]
+    else:
+        candidates = np.empty(state.n_tiles, dtype='i')
+        for ti in range(state.n_tiles):
+            if is_frontier(partition, indptr, indices, ti):
+                candidates[n] = ti
+                n += 1
+        candidates = candidates[:n]
+    with nogil:
+        n = workspace._removable(partition, candidates, out)
+    return out[:n]
+
+cpdef int[:] articulationPoints(int[:] tile_districts, map, Workspace workspace=None) except *:
+    """ Per tile, 1 if it is an articulation point of its district. """
+    cdef int t
+    cdef int[:] ap = np.zeros(map.n_tiles, dtype='i')
+    if workspace is None:
+        workspace = Workspace(map)
+    with nogil:
+        for t in range(tile_districts.shape[0]):
+            if workspace.disc[t] == -1:
+                workspace._search(tile_districts, t)
+        for t in range(tile_districts.shape[0]):
+            ap[t] = workspace.ap[t]
+        workspace._reset()
     return ap
-
-# cpdef int[:] articulationPoints(
-#     int[:] tile_districts,
-#     map,
-#     cdef int[:] visited,
-#     cdef int[:] parent,
-#     cdef int[:] ap,
-#     cdef double[:] low,
-#     cdef double[:] disc
-# ) except *:
-#     cdef int time = 0
-#     cdef int n, t
-#     n = map.n_tiles
-
-#     visited.fill(0)
-#     parent.fill(-1)
-#     ap.fill(0)
-#     low.fill(np.inf)
-#     disc.fill(np.inf)
-#     cdef int[:] parent = np.full(n, -1.0, dtype='i')
-#     cdef int[:] ap = np.zeros(n, dtype='i')
-#     cdef double[:] low = np.full(n, np.inf)
-#     cdef double[:] disc = np.full(n, np.inf)
-
-#     for t in range(n):
-#         if not visited[t]:
-#             APUtil(&time, tile_districts, map, t, visited, ap, parent, low, disc)
-
-#     return ap
-
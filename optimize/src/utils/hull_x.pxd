@@ -0,0 +1,3 @@
+cdef void sort_points(double[:, ::1] points) nogil
+cdef int convex_hull(double[:, ::1] points, double[:, ::1] hull) nogil
+cdef double hull_area(double[:, ::1] hull, int n) nogil
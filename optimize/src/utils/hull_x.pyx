@@ -0,0 +1,186 @@
+# cython: boundscheck=False
+# cython: wraparound=False
+# cython: initializedcheck=False
+# cython: nonecheck=False
+# cython: cdivision=True
+""" Convex hulls of float point arrays, without the GIL. """
+from libc.math cimport fabs
+import numpy as np
+cimport numpy as np
+
+cdef inline double cross(double ox, double oy, double ax, double ay, double bx, double by) nogil:
+    return (ax - ox) * (by - oy) - (ay - oy) * (bx - ox)
+
+# The sort works on the raw rows of a C contiguous (n, 2) array.
+cdef inline bint less(double* p, int i, int j) nogil:
+    return p[2*i] < p[2*j] or (p[2*i] == p[2*j] and p[2*i+1] < p[2*j+1])
+
+cdef inline void swap(double* p, int i, int j) nogil:
+    cdef double x = p[2*i]
+    cdef double y = p[2*i+1]
+    p[2*i] = p[2*j]
+    p[2*i+1] = p[2*j+1]
+    p[2*j] = x
+    p[2*j+1] = y
+
+cdef inline void sift_down(double* p, int i, int n) nogil:
+    cdef int child
+    while 2*i + 1 < n:
+        child = 2*i + 1
+        if child + 1 < n and less(p, child, child+1):
+            child += 1
+        if not less(p, i, child):
+            return
+        swap(p, i, child)
+        i = child
+
+cdef void sort_points(double[:, ::1] points) nogil:
+    """ Heapsort the rows of points by x then y. """
+    cdef int i
+    cdef int n = points.shape[0]
+    if n < 2:
+        return
+    cdef double* p = &points[0, 0]
+    for i in range(n // 2 - 1, -1, -1):
+        sift_down(p, i, n)
+    for i in range(n - 1, 0, -1):
+        swap(p, 0, i)
+        sift_down(p, 0, i)
+
+cdef int discard_interior(double[:, ::1] points) nogil:
+    """ Akl-Toussaint heuristic. Moves the points that are not strictly inside
+        the octagon of the extreme points in 8 directions to the front of
+        points and returns their number. Interior points are never on the hull.
+    """
+    cdef int n = points.shape[0]
+    cdef int extremes[8]
+    cdef double scores[8]
+    cdef double x, y, v
+    cdef int i, k, m, a, b
+    for k in range(8):
+        extremes[k] = 0
+    for i in range(n):
+        x, y = points[i, 0], points[i, 1]
+        # Directions in counter clockwise order, starting from -x.
+        for k in range(8):
+            if   k == 0: v = -x
+            elif k == 1: v = -x - y
+            elif k == 2: v = -y
+            elif k == 3: v = x - y
+            elif k == 4: v = x
+            elif k == 5: v = x + y
+            elif k == 6: v = y
+            else:        v = y - x
+            if i == 0 or v > scores[k]:
+                scores[k] = v
+                extremes[k] = i
+    # Copy the octagon out, skipping repeated corners.
+    cdef double octagon[16]
+    m = 0
+    for k in range(8):
+        i = extremes[k]
+        if m == 0 or points[i, 0] != octagon[2*m-2] or points[i, 1] != octagon[2*m-1]:
+            octagon[2*m] = points[i, 0]
+            octagon[2*m+1] = points[i, 1]
+            m += 1
+    if m > 1 and octagon[0] == octagon[2*m-2] and octagon[1] == octagon[2*m-1]:
+        m -= 1
+    if m < 3:
+        return n
+    cdef int kept = 0
+    cdef bint inside
+    for i in range(n):
+        x, y = points[i, 0], points[i, 1]
+        inside = True
+        for k in range(m):
+            a, b = k, (k + 1) % m
+            if cross(octagon[2*a], octagon[2*a+1], octagon[2*b], octagon[2*b+1], x, y) <= 0:
+                inside = False
+                break
+        if not inside:
+            points[kept, 0] = x
+            points[kept, 1] = y
+            kept += 1
+    return kept
+
+cdef int convex_hull(double[:, ::1] points, double[:, ::1] hull) nogil:
+    """ Andrew's monotone chain. Reorders points in place and writes the hull
+        to hull, counter clockwise without repeating the first point.
+        Duplicate and collinear points are dropped. hull needs
+        points.shape[0]+1 rows. Returns the number of hull points.
+    """
+    cdef int i, t
+    cdef int k = 0
+    cdef int n = points.shape[0]
+    if n < 3:
+        for i in range(n):
+            hull[i, 0] = points[i, 0]
+            hull[i, 1] = points[i, 1]
+        return n
+    n = discard_interior(points)
+    points = points[:n]
+    sort_points(points)
+    # Lower hull, then the upper hull back to the start.
+    for i in range(n):
+        while k >= 2 and cross(hull[k-2, 0], hull[k-2, 1], hull[k-1, 0], hull[k-1, 1],
+                               points[i, 0], points[i, 1]) <= 0:
+            k -= 1
+        hull[k, 0] = points[i, 0]
+        hull[k, 1] = points[i, 1]
+        k += 1
+    t = k + 1
+    for i in range(n - 2, -1, -1):
+        while k >= t and cross(hull[k-2, 0], hull[k-2, 1], hull[k-1, 0], hull[k-1, 1],
+                               points[i, 0], points[i, 1]) <= 0:
+            k -= 1
+        hull[k, 0] = points[i, 0]
+        hull[k, 1] = points[i, 1]
+        k += 1
+    return k - 1
+
+cdef double hull_area(double[:, ::1] hull, int n) nogil:
+    """ Area of the first n points of hull, a convex polygon in order. """
+    cdef double area = 0.0
+    cdef int i, j
+    for i in range(n):
+        j = i + 1 if i + 1 < n else 0
+        area += (hull[j, 0] - hull[i, 0]) * (hull[j, 1] + hull[i, 1])
+    return fabs(area) / 2.0
+
+def tile_hulls(vertices, polygon_indptr, tile_polygon_indptr):
+    """ Convex hull of the vertices of each tile of a packed state (see
+        statefile). Returns (hull_indptr, hull_points), the hull of tile ti is
+        hull_points[hull_indptr[ti]:hull_indptr[ti+1]], counter clockwise.
+    """
+    cdef double[:, :] vertices_v = np.asarray(vertices, dtype='d')
+    cdef np.int64_t[:] starts = np.asarray(polygon_indptr, dtype='i8')[np.asarray(tile_polygon_indptr)]
+    cdef int n_tiles = starts.shape[0] - 1
+    cdef np.int64_t[:] hull_indptr = np.zeros(n_tiles+1, dtype='i8')
+    cdef double[:, :] hull_points = np.empty((vertices_v.shape[0], 2), dtype='d')
+    cdef int max_size = np.diff(starts).max() if n_tiles > 0 else 0
+    cdef double[:, ::1] points = np.empty((max_size, 2), dtype='d')
+    cdef double[:, ::1] hull = np.empty((max_size+1, 2), dtype='d')
+    cdef int ti, k, size
+    cdef np.int64_t offset = 0
+    with nogil:
+        for ti in range(n_tiles):
+            size = starts[ti+1] - starts[ti]
+            points[:size] = vertices_v[starts[ti]:starts[ti+1]]
+            size = convex_hull(points[:size], hull)
+            for k in range(size):
+                hull_points[offset+k, 0] = hull[k, 0]
+                hull_points[offset+k, 1] = hull[k, 1]
+            offset += size
+            hull_indptr[ti+1] = offset
+    return np.asarray(hull_indptr), np.asarray(hull_points[:offset]).copy()
+
+def convex_hull_points(points):
+    """ Convex hull of a sequence of (x, y) points as a (n, 2) array,
+        counter clockwise.
+    """
+    cdef double[:, ::1] arr = np.array(points, dtype='d').reshape(-1, 2)
+    cdef double[:, ::1] hull = np.empty((arr.shape[0]+1, 2), dtype='d')
+    cdef int n
+    with nogil:
+        n = convex_hull(arr, hull)
+    return np.asarray(hull[:n]).copy()
@@ -0,0 +1,5 @@
+cdef struct Circle:
+    double x, y, r
+
+cdef Circle minimum_circle(double[:, ::1] points, int n) nogil
+cdef Circle bounding_circle(double[:, ::1] points, double[:, ::1] hull) nogil
@@ -0,0 +1,138 @@
+# cython: boundscheck=False
+# cython: wraparound=False
+# cython: initializedcheck=False
+# cython: nonecheck=False
+# cython: cdivision=True
+#
+# Smallest enclosing circle, ported from the Project Nayuki library:
+# Copyright (c) 2018 Project Nayuki
+# https://www.nayuki.io/page/smallest-enclosing-circle
+# Licensed under the GNU Lesser General Public License, version 3 or later.
+#
+""" Smallest enclosing circle of float arrays, without the GIL. Points are
+    first reduced to their convex hull, the circle only depends on those.
+"""
+from libc.math cimport hypot, fmax
+import numpy as np
+from src.utils.hull_x cimport convex_hull
+
+cdef double MULTIPLICATIVE_EPSILON = 1 + 1e-14
+
+cdef inline bint in_circle(Circle c, double x, double y) nogil:
+    return c.r >= 0 and hypot(x - c.x, y - c.y) <= c.r * MULTIPLICATIVE_EPSILON
+
+cdef inline double cross(double x0, double y0, double x1, double y1, double x2, double y2) nogil:
+    """ Twice the signed area of the triangle (x0, y0), (x1, y1), (x2, y2). """
+    return (x1 - x0) * (y2 - y0) - (y1 - y0) * (x2 - x0)
+
+cdef Circle diameter(double ax, double ay, double bx, double by) nogil:
+    cdef Circle c
+    c.x = (ax + bx) / 2.0
+    c.y = (ay + by) / 2.0
+    c.r = fmax(hypot(c.x - ax, c.y - ay), hypot(c.x - bx, c.y - by))
+    return c
+
+cdef Circle circumcircle(
+    double px, double py, double qx, double qy, double rx, double ry
+) nogil:
+    """ Returns a circle with negative radius if the points are collinear. """
+    cdef Circle c
+    cdef double ox = (min(px, qx, rx) + max(px, qx, rx)) / 2.0
+    cdef double oy = (min(py, qy, ry) + max(py, qy, ry)) / 2.0
+    cdef double ax = px - ox, ay = py - oy
+    cdef double bx = qx - ox, by = qy - oy
+    cdef double cx = rx - ox, cy = ry - oy
+    cdef double d = (ax * (by - cy) + bx * (cy - ay) + cx * (ay - by)) * 2.0
+    if d == 0.0:
+        c.r = -1
+        return c
+    c.x = ox + ((ax*ax + ay*ay) * (by - cy) + (bx*bx + by*by) * (cy - ay) + (cx*cx + cy*cy) * (ay - by)) / d
+    c.y = oy + ((ax*ax + ay*ay) * (cx - bx) + (bx*bx + by*by) * (ax - cx) + (cx*cx + cy*cy) * (bx - ax)) / d
+    c.r = fmax(fmax(hypot(c.x - px, c.y - py), hypot(c.x - qx, c.y - qy)), hypot(c.x - rx, c.y - ry))
+    return c
+
+cdef Circle circle_two_points(double[:, ::1] points, int n, double px, double py, double qx, double qy) nogil:
+    """ Smallest circle of the first n points with p and q on its boundary. """
+    cdef Circle circ = diameter(px, py, qx, qy)
+    cdef Circle left, right, c
+    cdef double c_cross
+    cdef int i
+    left.r = -1
+    right.r = -1
+    for i in range(n):
+        if in_circle(circ, points[i, 0], points[i, 1]):
+            continue
+        # Form a circumcircle and classify it on left or right side.
+        c_cross = cross(px, py, qx, qy, points[i, 0], points[i, 1])
+        c = circumcircle(px, py, qx, qy, points[i, 0], points[i, 1])
+        if c.r < 0:
+            continue
+        elif c_cross > 0.0 and (left.r < 0 or cross(px, py, qx, qy, c.x, c.y) > cross(px, py, qx, qy, left.x, left.y)):
+            left = c
+        elif c_cross < 0.0 and (right.r < 0 or cross(px, py, qx, qy, c.x, c.y) < cross(px, py, qx, qy, right.x, right.y)):
+            right = c
+    if left.r < 0 and right.r < 0:
+        return circ
+    elif left.r < 0:
+        return right
+    elif right.r < 0:
+        return left
+    return left if left.r <= right.r else right
+
+cdef Circle circle_one_point(double[:, ::1] points, int n, double px, double py) nogil:
+    """ Smallest circle of the first n points with p on its boundary. """
+    cdef Circle c
+    cdef int i
+    c.x = px
+    c.y = py
+    c.r = 0.0
+    for i in range(n):
+        if not in_circle(c, points[i, 0], points[i, 1]):
+            if c.r == 0.0:
+                c = diameter(px, py, points[i, 0], points[i, 1])
+            else:
+                c = circle_two_points(points, i+1, px, py, points[i, 0], points[i, 1])
+    return c
+
+cdef Circle minimum_circle(double[:, ::1] points, int n) nogil:
+    """ Welzl's algorithm over the first n rows of points, which are shuffled
+        in place with a fixed seed so results are reproducible. Returns a
+        circle with negative radius when n is 0.
+    """
+    cdef Circle c
+    cdef unsigned int seed = 2463534242
+    cdef int i, j
+    cdef double x, y
+    c.r = -1
+    for i in range(n - 1, 0, -1):
+        # xorshift32
+        seed ^= seed << 13
+        seed ^= seed >> 17
+        seed ^= seed << 5
+        j = seed % (i + 1)
+        x, y = points[i, 0], points[i, 1]
+        points[i, 0], points[i, 1] = points[j, 0], points[j, 1]
+        points[j, 0], points[j, 1] = x, y
+    for i in range(n):
+        if not in_circle(c, points[i, 0], points[i, 1]):
+            c = circle_one_point(points, i+1, points[i, 0], points[i, 1])
+    return c
+
+cdef Circle bounding_circle(double[:, ::1] points, double[:, ::1] hull) nogil:
+    """ Smallest circle enclosing points, which are reordered. hull is
+        scratch with points.shape[0]+1 rows.
+    """
+    return minimum_circle(hull, convex_hull(points, hull))
+
+cpdef tuple make_circle(points):
+    """ The smallest circle (x, y, r) enclosing a sequence of (x, y) points,
+        or None if there are none.
+    """
+    cdef double[:, ::1] arr = np.array(points, dtype='d').reshape(-1, 2)
+    cdef double[:, ::1] hull = np.empty((arr.shape[0]+1, 2), dtype='d')
+    cdef Circle c
+    with nogil:
+        c = bounding_circle(arr, hull)
+    if c.r < 0:
+        return None
+    return (c.x, c.y, c.r)
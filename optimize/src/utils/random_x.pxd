@@ -0,0 +1,17 @@
+""" A small inline random number generator for nogil code. Each stream is a
+    single uint64 of state, so rows of a batch can each own one and stay
+    reproducible whatever the thread count.
+"""
+cimport numpy as np
+
+cdef inline np.uint64_t next_random(np.uint64_t *state) nogil:
+    """ splitmix64. """
+    state[0] += 0x9E3779B97F4A7C15ULL
+    cdef np.uint64_t z = state[0]
+    z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9ULL
+    z = (z ^ (z >> 27)) * 0x94D049BB133111EBULL
+    return z ^ (z >> 31)
+
+cdef inline int random_below(np.uint64_t *state, int n) nogil:
+    """ A random int in [0, n). """
+    return <int>(next_random(state) % <np.uint64_t>n)
@@ -0,0 +1,149 @@
+""" Fast synthetic states for testing and benchmarks.
+
+    Tiles are bricks on a jittered grid, every other row offset by half a
+    brick, so each interior tile has six neighbors like a Voronoi cell. All
+    of the geometry and adjacency is built with array operations and returned
+    in the packed statefile format, so large states never go through pyvoro
+    or per-tile Python loops.
+"""
+import numpy as np
+import scipy.sparse
+
+BRICK_WIDTH = 100
+BRICK_HEIGHT = 80
+
+def _row_pieces(n_half_cols, odd):
+    """ Start and end half-columns of the bricks in a row. """
+    if odd:
+        a = np.r_[0, np.arange(1, n_half_cols, 2)]
+        b = np.r_[np.arange(1, n_half_cols, 2), n_half_cols]
+    else:
+        a = np.arange(0, n_half_cols, 2)
+        b = a + 2
+    return a, b
+
+def brick_tiling(n_tiles, jitter=0.3, rng=np.random):
+    """ Jittered brick geometry for n_tiles tiles, the last row may be partial.
+        Returns a dict of packed arrays (see statefile) without tile data.
+    """
+    nx = max(2, int(round(np.sqrt(n_tiles * BRICK_HEIGHT / BRICK_WIDTH))))
+    n_half_cols = 2 * nx
+    rows, starts, ends = [], [], []
+    count, j = 0, 0
+    while count < n_tiles:
+        a, b = _row_pieces(n_half_cols, j % 2 == 1)
+        a, b = a[:n_tiles-count], b[:n_tiles-count]
+        rows.append(np.full(len(a), j))
+        starts.append(a)
+        ends.append(b)
+        count += len(a)
+        j += 1
+    n_rows = j
+    rows, starts, ends = np.concatenate(rows), np.concatenate(starts), np.concatenate(ends)
+
+    # Lattice points, vertex id of (k, j) is j * (n_half_cols+1) + k.
+    k, j = np.meshgrid(np.arange(n_half_cols+1), np.arange(n_rows+1))
+    points = np.stack([ k * BRICK_WIDTH / 2, j * BRICK_HEIGHT ], axis=-1).astype('f8')
+    interior = (k > 0) & (k < n_half_cols) & (j > 0) & (j < n_rows)
+    offsets = rng.uniform(-jitter, jitter, size=points.shape) * [ BRICK_WIDTH / 2, BRICK_HEIGHT ]
+    points[interior] += offsets[interior]
+    points = np.round(points.reshape(-1, 2))
+
+    # Polygons go along the bottom edge then back along the top edge.
+    sizes = 2 * (ends - starts + 1)
+    polygon_indptr = np.zeros(n_tiles+1, dtype='i8')
+    np.cumsum(sizes, out=polygon_indptr[1:])
+    vertex_ids = np.empty(polygon_indptr[-1], dtype='i8')
+    for width in (1, 2):
+        tiles = np.flatnonzero(ends - starts == width)
+        dk = np.r_[np.arange(width+1), np.arange(width, -1, -1)]
+        dj = np.repeat([ 0, 1 ], width+1)
+        ids = (rows[tiles, None] + dj) * (n_half_cols+1) + starts[tiles, None] + dk
+        vertex_ids[polygon_indptr[tiles, None] + np.arange(len(dk))] = ids
+
+    neighbors_indptr, neighbors_indices, boundaries = _segment_adjacency(
+        vertex_ids, polygon_indptr, n_tiles
+    )
+    return {
+        'n_tiles': n_tiles,
+        'bbox': [ 0, 0, nx * BRICK_WIDTH, n_rows * BRICK_HEIGHT ],
+        'vertices': points[vertex_ids],
+        'polygon_indptr': polygon_indptr,
+        'tile_polygon_indptr': np.arange(n_tiles+1, dtype='i8'),
+        'neighbors_indptr': neighbors_indptr,
+        'neighbors_indices': neighbors_indices,
+        'boundaries': boundaries,
+    }
+
+def _segment_adjacency(vertex_ids, polygon_indptr, n_tiles):
+    """ CSR adjacency and boundary flags of single polygon tiles from the
+        segments (pairs of vertex ids) they share.
+    """
+    tile_of = np.repeat(np.arange(n_tiles), np.diff(polygon_indptr))
+    nxt = np.arange(1, len(vertex_ids)+1)
+    nxt[polygon_indptr[1:]-1] = polygon_indptr[:-1]
+    u, v = vertex_ids, vertex_ids[nxt]
+    keys = np.minimum(u, v) * (vertex_ids.max()+1) + np.maximum(u, v)
+    order = np.argsort(keys, kind='stable')
+    keys, tile_of = keys[order], tile_of[order]
+    _, first, counts = np.unique(keys, return_index=True, return_counts=True)
+    assert counts.max() <= 2
+
+    boundaries = np.zeros(n_tiles, dtype='i4')
+    boundaries[tile_of[first[counts == 1]]] = 1
+    shared = first[counts == 2]
+    src = np.r_[tile_of[shared], tile_of[shared+1]]
+    dst = np.r_[tile_of[shared+1], tile_of[shared]]
+    adjacency = scipy.sparse.csr_matrix((np.ones(len(src)), (src, dst)), shape=(n_tiles, n_tiles))
+    adjacency.sum_duplicates()
+    adjacency.sort_indices()
+    return adjacency.indptr.astype('i4'), adjacency.indices.astype('i4'), boundaries
+
+def smooth(values, indptr, indices, steps):
+    """ Average each row of values with the mean of its neighbors, steps times. """
+    n = len(indptr) - 1
+    adjacency = scipy.sparse.csr_matrix(
+        (np.ones(len(indices)), np.asarray(indices), np.asarray(indptr)), shape=(n, n)
+    )
+    degree = np.diff(indptr).reshape(-1, *([1] * (values.ndim-1)))
+    for _ in range(steps):
+        values = 0.5 * (adjacency @ values / degree + values)
+    return values
+
+def random_voters(indptr, indices, n_cities=3, total_pop=1e6, city_strength=.1,
+                  voter_turnout=0.7, smooth_steps=6, rng=np.random):
+    """ Random populations and 2-party voters, the same model as
+        State.makeRandom. Returns (populations, voters).
+    """
+    n_tiles = len(indptr) - 1
+    noise = rng.uniform(low=0.2, high=0.8, size=(n_tiles,))
+    tile_voters = np.array([ noise, 1-noise ]).T
+    # Assumes cities skew to one party.
+    cities = rng.choice(n_tiles, size=n_cities, replace=False)
+    tile_voters[cities, 0] = n_tiles * city_strength / max(n_cities, 1)
+    tile_voters = smooth(tile_voters, indptr, indices, smooth_steps)
+    # Ensure same number of each party.
+    tile_voters /= tile_voters.sum(axis=0)
+    tile_populations = tile_voters.sum(axis=1) / voter_turnout
+    scale = total_pop / tile_populations.sum()
+    tile_populations = (scale * tile_populations).astype('i')
+    tile_voters = (scale * tile_voters).astype('i')
+    assert (tile_voters.sum(axis=1) < tile_populations).all()
+    return tile_populations, tile_voters
+
+def random_state(n_tiles, n_cities=3, seed=None, total_pop=None, **kwargs):
+    """ A random brick state as a dict of packed arrays, ready for
+        statefile.write or State(). total_pop defaults to 1000 per tile.
+    """
+    if total_pop is None:
+        total_pop = 1000 * n_tiles
+    rng = np.random.RandomState(seed)
+    packed = brick_tiling(n_tiles, rng=rng)
+    populations, voters = random_voters(
+        packed['neighbors_indptr'], packed['neighbors_indices'],
+        n_cities=n_cities, total_pop=total_pop, rng=rng, **kwargs
+    )
+    packed['populations'] = populations
+    packed['voters'] = voters
+    packed['population'] = int(populations.sum())
+    return packed